@@ -0,0 +1,49 @@
+"""Times diagram construction on a synthetic pangenome for increasing worker counts.
+
+    python -m benchmarks.diagram_construction --sequences 10000 --columns 2000 --workers 1 2 4 8
+
+Worker counts above the number of available cores only add process start-up and merge costs.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from dash_app.components import poagraph
+
+
+def get_synthetic_paths(sequences_count, columns_count, bubble_size, seed):
+    # EVERY COLUMN HOLDS UP TO bubble_size ALTERNATIVE NODES, EACH SEQUENCE PASSES ONE OF THEM
+    rng = np.random.default_rng(seed)
+    column_sizes = rng.integers(1, bubble_size+1, columns_count)
+    column_offsets = np.zeros(columns_count+1, dtype=np.int64)
+    np.cumsum(column_sizes, out=column_offsets[1:])
+    choices = (rng.random((sequences_count, columns_count)) ** 3 * column_sizes).astype(np.int64)
+    paths = (column_offsets[:-1] + choices).astype(np.int32).ravel()
+    offsets = np.arange(sequences_count+1, dtype=np.int64) * columns_count
+    return paths, offsets, int(column_offsets[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sequences", type=int, default=10000)
+    parser.add_argument("--columns", type=int, default=2000)
+    parser.add_argument("--bubble-size", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths, offsets, nodes_count = get_synthetic_paths(args.sequences, args.columns, args.bubble_size, args.seed)
+    print(f"{args.sequences} sequences, {nodes_count} nodes, {len(paths)} path steps, {os.cpu_count()} cores")
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        diagram = poagraph.get_edges(paths, offsets, nodes_count, workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {elapsed:8.2f} s  speedup {baseline / elapsed:5.2f}x  edges {len(diagram.weights)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Bytes of hidden-div state sent per PangTreeVis interaction, as JSON strings and as server-side keys.
+
+    python -m benchmarks.hidden_state_payloads example_data/pangtreevis/ebola_subset/pangenome.json --slider 0.5
+"""
+import argparse
+import hashlib
+import json
+
+from dash_app.components import consensustable, consensustree, pangenome, views
+
+# HIDDEN STATE EACH CALLBACK RECEIVES (INPUTS AND STATES) AND RETURNS, PER USER INTERACTION,
+# pangenome_hidden NO LONGER EXISTS WITH THE SERVER-SIDE STORE
+INTERACTIONS = {
+    "poagraph slider tick": [
+        (["visualisation_session_info", "pangenome_hidden"], []),
+        (["visualisation_session_info", "pangenome_hidden"], []),
+    ],
+    "consensus tree slider tick": [
+        (["full_consensustable_hidden", "full_consensustree_hidden"], ["partial_consensustable_hidden"]),
+        (["partial_consensustable_hidden", "full_consensustree_hidden"], []),
+    ],
+    "leaf info change": [
+        (["current_consensustree_hidden", "full_consensustable_hidden"], []),
+    ],
+}
+
+
+def get_json_state(text, slider_value):
+    """Hidden divs as they were filled before the server-side store, the dataset key travelled with them."""
+    data = pangenome.read_text(text)
+    full_table = consensustable.get_full_table_data(data)
+    tree = consensustree.get_consensustree(data)
+    tree_json = json.dumps(consensustree.tree_to_dict(tree))
+    return {
+        "visualisation_session_info": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        "pangenome_hidden": text,
+        "full_consensustable_hidden": full_table.to_json(),
+        "full_consensustree_hidden": tree_json,
+        "current_consensustree_hidden": tree_json,
+        "partial_consensustable_hidden": consensustable.remove_smaller_than_slider(full_table, tree, slider_value).to_json(),
+    }
+
+
+def get_key_state(dataset_key, slider_value):
+    consensustree_key = views.get_key("consensustree", dataset_key)
+    return {
+        "visualisation_session_info": dataset_key,
+        "full_consensustable_hidden": views.get_key("full_consensustable", dataset_key),
+        "full_consensustree_hidden": consensustree_key,
+        "current_consensustree_hidden": consensustree_key,
+        "partial_consensustable_hidden": views.get_key("partial_consensustable", dataset_key, slider_value),
+    }
+
+
+def get_transferred(state, callbacks):
+    return sum(len(json.dumps(state[name])) for received, returned in callbacks
+               for name in [*received, *returned] if name in state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pangenome")
+    parser.add_argument("--slider", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with open(args.pangenome) as f:
+        text = f.read()
+    json_state = get_json_state(text, args.slider)
+    key_state = get_key_state(json_state["visualisation_session_info"], args.slider)
+    for interaction, callbacks in INTERACTIONS.items():
+        before = get_transferred(json_state, callbacks)
+        after = get_transferred(key_state, callbacks)
+        print(f"{interaction:<28} {before:>12} B as JSON  {after:>8} B as keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+// DECODES FIGURES PACKED BY dash_app/components/figures.py
+(function () {
+    var TYPED_ARRAYS = {
+        "<i4": Int32Array,
+        "<f4": Float32Array,
+        "<u1": Uint8Array
+    };
+
+    function decodeArray(value) {
+        var binary = atob(value.bdata);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new TYPED_ARRAYS[value.dtype](bytes.buffer);
+    }
+
+    function decodeValues(value) {
+        if (Array.isArray(value)) {
+            return value.map(decodeValues);
+        }
+        if (value === null || typeof value !== "object") {
+            return value;
+        }
+        if (value.bdata !== undefined && value.dtype !== undefined) {
+            return decodeArray(value);
+        }
+        if (value.palette !== undefined && value.indices !== undefined) {
+            return Array.from(decodeArray(value.indices), function (index) { return value.palette[index]; });
+        }
+        var decoded = {};
+        Object.keys(value).forEach(function (key) {
+            decoded[key] = decodeValues(value[key]);
+        });
+        return decoded;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        figures: {
+            decode: function (payload) {
+                if (!payload) {
+                    return {data: [], layout: {}};
+                }
+                return {data: decodeValues(payload.data), layout: payload.layout};
+            }
+        }
+    });
+})();
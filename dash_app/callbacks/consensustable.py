@@ -1,65 +1,106 @@
-import json
-
-import pandas as pd
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
-from pangtreebuild.serialization.json import str_to_PangenomeJSON
 
-from dash_app.components import consensustable, consensustree
+from dash_app.components import consensustable, views
+from dash_app.components.coalescing import coalescer
 from dash_app.server import app
 
 
 @app.callback(
     [Output("full_consensustable_hidden", 'children'),
      Output("consensus_table_container", 'style')],
-    [Input("pangenome_hidden", 'children')],
+    [Input("visualisation_session_info", 'data')],
     [State("consensus_table_container", 'style')])
-def update_full_consensustable_hidden(jsonified_pangenome, current_table_style):
-    if not jsonified_pangenome:
+def update_full_consensustable_hidden(dataset_key, current_table_style):
+    if not dataset_key:
         return [], {'display': 'none'}
     if current_table_style['display'] == 'block':
         raise PreventUpdate()
-    jsonpangenome = str_to_PangenomeJSON(jsonified_pangenome)
-    consensustable_data = consensustable.get_full_table_data(jsonpangenome)
-    return consensustable_data.to_json(), {'display': 'block'}
+    full_consensustable_key = views.get_key("full_consensustable", dataset_key)
+    views.get(full_consensustable_key)
+    return full_consensustable_key, {'display': 'block'}
 
 
 @app.callback(
     Output("partial_consensustable_hidden", 'children'),
     [Input("full_consensustable_hidden", 'children'),
      Input("full_consensustree_hidden", 'children'),
-     Input("consensus_tree_slider", 'value')])
-def update_partial_table_data(jsonified_full_consensustable: str, jsonified_tree: str,
-                              slider_value: float):
-    if not jsonified_full_consensustable or not jsonified_tree:
+     Input("consensus_tree_slider", 'value')],
+    [State("page_id", "data")])
+@coalescer.latest_wins("partial_consensustable_hidden")
+def update_partial_table_data(full_consensustable_key: str, consensustree_key: str, slider_value: float):
+    if not full_consensustable_key or not consensustree_key:
         return []
-    full_consensustable_data = pd.read_json(jsonified_full_consensustable)
-    full_consensustree_data = json.loads(jsonified_tree)
-    full_consensustree_tree = consensustree.dict_to_tree(full_consensustree_data)
-    table_without_consensuses_smaller_than_slider = consensustable.remove_smaller_than_slider(
-        full_consensustable_data,
-        full_consensustree_tree,
-        slider_value)
-    return table_without_consensuses_smaller_than_slider.to_json()
+    partial_consensustable_key = views.get_key("partial_consensustable",
+                                               views.get_dataset_key(full_consensustable_key),
+                                               slider_value)
+    views.get(partial_consensustable_key)
+    return partial_consensustable_key
+
+
+@app.callback(
+    [Output("consensuses_table_columns_offset", 'max'),
+     Output("consensuses_table_columns_offset", 'marks'),
+     Output("consensuses_table_columns_offset", 'value')],
+    [Input("partial_consensustable_hidden", 'children')],
+    [State("consensuses_table_columns_offset", 'value')])
+def update_columns_offset_slider(partial_consensustable_key, columns_offset):
+    if not partial_consensustable_key:
+        return 0, {}, 0
+    consensus_columns = [column for column in views.get(partial_consensustable_key) if "CONSENSUS" in column]
+    slider_max = max(len(consensus_columns) - consensustable.CONSENSUS_COLUMNS_WINDOW, 0)
+    slider_marks = {i: {"label": consensus_columns[i]} for i in range(0, slider_max+1, consensustable.CONSENSUS_COLUMNS_WINDOW)}
+    # FEWER CONSENSUSES MAY BE SHOWN THAN BEFORE, THE WINDOW STAYS ON THE LAST ONES
+    return slider_max, slider_marks, min(columns_offset or 0, slider_max)
+
+
+@app.callback(
+    Output("consensuses_table", 'page_current'),
+    [Input("partial_consensustable_hidden", 'children'),
+     Input("consensuses_table", 'sort_by')])
+def reset_consensus_table_page(partial_consensustable_key, sort_by):
+    # ANOTHER DATASET, CONSENSUS SUBSET OR ORDER STARTS FROM THE FIRST PAGE
+    return 0
 
 
 @app.callback(
     [Output("consensuses_table", 'data'),
      Output("consensuses_table", 'columns'),
-     Output("consensuses_table", 'style_data_conditional')],
-    [Input("partial_consensustable_hidden", 'children')],
+     Output("consensuses_table", 'style_data_conditional'),
+     Output("consensuses_table", 'page_count')],
+    [Input("partial_consensustable_hidden", 'children'),
+     Input("consensuses_table", 'page_current'),
+     Input("consensuses_table", 'page_size'),
+     Input("consensuses_table", 'sort_by'),
+     Input("consensuses_table_columns_offset", 'value')],
     [State("full_consensustree_hidden", 'children')])
-def update_consensus_table(jsonified_partial_consensustable, jsonified_consensus_tree):
-    if not jsonified_partial_consensustable:
+def update_consensus_table(partial_consensustable_key, page_current, page_size, sort_by, columns_offset,
+                           consensustree_key):
+    if not partial_consensustable_key:
         # return [], [{}], []
-        return [{"ID": 0}, {"ID": 1}], [{"name": i, "id": i} for i in ["ID"]], []
-    partial_consensustable_data = pd.read_json(jsonified_partial_consensustable)
-    consensustable_columns = [{"name": i, "id": i} for i in partial_consensustable_data.columns]
-    consensustable_content = partial_consensustable_data.to_dict("rows")
+        return [{"ID": 0}, {"ID": 1}], [{"name": i, "id": i} for i in ["ID"]], [], 1
+    dataset_key = views.get_dataset_key(partial_consensustable_key)
+    full_consensustable_data = views.get(views.get_key("full_consensustable", dataset_key))
+    visible_columns = views.get(partial_consensustable_key)
+    columns_window = consensustable.get_columns_window([c for c in visible_columns if "CONSENSUS" not in c],
+                                                       [c for c in visible_columns if "CONSENSUS" in c],
+                                                       columns_offset or 0)
+    # ONLY THE REQUESTED PAGE OF THE VISIBLE COLUMN WINDOW IS SENT
+    rows_count = len(full_consensustable_data)
+    page_count = max(-(-rows_count // page_size), 1)
+    page_start = min(page_current or 0, page_count-1) * page_size
+    if sort_by:
+        rows_order = views.get(views.get_key("rows_order", dataset_key,
+                                             [[s["column_id"], s["direction"]] for s in sort_by]))
+        page_rows = rows_order[page_start:page_start+page_size]
+    else:
+        page_rows = slice(page_start, page_start+page_size)
+    page_data = full_consensustable_data.iloc[page_rows, full_consensustable_data.columns.get_indexer(columns_window)]
+    consensustable_columns = consensustable.get_table_columns(page_data)
+    consensustable_content = page_data.to_dict("records")
 
-    if not jsonified_consensus_tree:
-        return consensustable_content, consensustable_columns, []
-    consensustree_data = json.loads(jsonified_consensus_tree)
-    tree = consensustree.dict_to_tree(consensustree_data)
-    color_cells = consensustable.get_cells_styling(tree, partial_consensustable_data)
-    return consensustable_content, consensustable_columns, color_cells
+    if not consensustree_key:
+        return consensustable_content, consensustable_columns, [], page_count
+    tree = views.get(consensustree_key)
+    color_cells = consensustable.get_cells_styling(tree, page_data)
+    return consensustable_content, consensustable_columns, color_cells, page_count
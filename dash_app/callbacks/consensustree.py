@@ -1,58 +1,59 @@
-import json
-import pandas as pd
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output
 
-from dash_app.components import consensustable, consensustree, tools
+from dash_app.components import consensustable, consensustree, figures, views
 from dash_app.server import app
 
 
 @app.callback(
     Output("full_consensustree_hidden", 'children'),
-    [Input("pangenome_hidden", 'children')]
+    [Input("visualisation_session_info", 'data')]
 )
-def update_consensustree_hidden(jsonified_pangenome):
-    if not jsonified_pangenome:
+def update_consensustree_hidden(dataset_key):
+    if not dataset_key:
         return []
-    jsonpangenome = tools.unjsonify_jsonpangenome(jsonified_pangenome)
-    consensustree_dict = consensustree.get_consensustree_dict(jsonpangenome)
-    return json.dumps(consensustree_dict)
+    consensustree_key = views.get_key("consensustree", dataset_key)
+    views.get(consensustree_key)
+    return consensustree_key
 
 
 @app.callback(
     Output("current_consensustree_hidden", 'children'),
     [Input("full_consensustree_hidden", 'children')]
 )
-def update_current_tree_state(jsonified_full_consensustree):
-    if not jsonified_full_consensustree:
+def update_current_tree_state(consensustree_key):
+    if not consensustree_key:
         return []
-    full_consensustree_data = json.loads(jsonified_full_consensustree)
-    full_consensus_tree = consensustree.dict_to_tree(full_consensustree_data)
-    current_consensustree_data = consensustree.tree_to_dict(full_consensus_tree)
-    return json.dumps(current_consensustree_data)
+    # THE CURRENT TREE IS THE FULL ONE, BOTH RESOLVE TO THE SAME SERVER-SIDE GRAPH
+    return consensustree_key
 
 
 @app.callback(
-    Output("consensus_tree_graph", 'figure'),
+    Output("consensus_tree_data", 'data'),
     [Input("current_consensustree_hidden", 'children'),
     #  Input("consensus_tree_slider", 'value'),
      Input("leaf_info_dropdown", 'value'),
      Input("full_consensustable_hidden", 'children')])
-def to_consensustree_graph(jsonified_current_consensustree, leaf_info,
-                           jsonified_full_consensustable):
-    if not jsonified_current_consensustree or not jsonified_full_consensustable:
+def to_consensustree_graph(current_consensustree_key, leaf_info, full_consensustable_key):
+    if not current_consensustree_key or not full_consensustable_key:
         return {}
-    current_consensustree_data = json.loads(jsonified_current_consensustree)
-    current_consensustree_tree = consensustree.dict_to_tree(current_consensustree_data)
-    full_consensustable_data = pd.read_json(jsonified_full_consensustable)
-    return consensustree.get_consensustree_graph(current_consensustree_tree, leaf_info, full_consensustable_data)
+    current_consensustree_tree = views.get(current_consensustree_key)
+    full_consensustable_data = views.get(full_consensustable_key)
+    fig = consensustree.get_consensustree_graph(current_consensustree_tree, leaf_info, full_consensustable_data)
+    return figures.encode_figure(fig, "to_consensustree_graph")
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="figures", function_name="decode"),
+    Output("consensus_tree_graph", 'figure'),
+    [Input("consensus_tree_data", 'data')])
 
 
 @app.callback(
     Output("leaf_info_dropdown", 'options'),
     [Input("full_consensustable_hidden", 'children')])
-def to_consensustree_leaf_info_options_dropdown(jsonified_full_consensustable):
-    if not jsonified_full_consensustable:
+def to_consensustree_leaf_info_options_dropdown(full_consensustable_key):
+    if not full_consensustable_key:
         return []
-    full_consensustable = pd.read_json(jsonified_full_consensustable)
+    full_consensustable = views.get(full_consensustable_key)
     metadata = consensustable.get_metadata_list(full_consensustable)
     return consensustree.get_leaf_info_dropdown_options(metadata)
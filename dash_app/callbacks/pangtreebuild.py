@@ -394,7 +394,11 @@ def get_poapangenome_result_description(session_state_data):
     if session_state_data is None or "jsonpangenome" not in session_state_data:
         return []
     jsonpangenome = tools.unjsonify_jsonpangenome(session_state_data["jsonpangenome"])
-    poapangenome_task_description = get_task_description_layout(jsonpangenome)
+    poapangenome_task_description = get_task_description_layout(
+        jsonpangenome.task_parameters,
+        len(jsonpangenome.nodes) if jsonpangenome.nodes else None,
+        len(jsonpangenome.sequences),
+        len(jsonpangenome.affinitytree))
     return poapangenome_task_description
 
 
@@ -1,20 +1,92 @@
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from dash.exceptions import PreventUpdate
 
-from dash_app.components import visualisation
+from dash_app.components import figures, poagraph
+from dash_app.components.coalescing import coalescer
 from dash_app.server import app
 
 
-@app.callback([Output("visualisation_session_info", "data"),
-               Output("elements_cache_info", "data")],
-              [Input("pangenome_upload", "contents")],
-              [State("elements_cache_info", "data"),
-               State("full_pangenome_graph", "figure")])
-def get_full_pangenome_graph(pangenome_upload_contents, cache_info, full_graph):
-    if full_graph or not pangenome_upload_contents:
+@app.callback(
+    [Output("poagraph_data", "data"),
+     Output("selected_vertex", "children")],
+    [Input("visualisation_session_info", "data"),
+     Input("zoom-out-switch", "on"),
+     Input("poagraph-slider", "value"),
+     Input("poagraph_dropdown", "value"),
+     Input("consensus_tree_graph", 'clickData'),
+     Input("poagraph_checklist", 'value'),
+     Input("poagraph_threshold", 'value')],
+    [State("page_id", "data")])
+@coalescer.latest_wins("poagraph_data")
+def get_sankey_diagram(dataset_key, zoom_out, slider_values, highlight_seq, click_data, checklist, threshold):
+    if not dataset_key:
         raise PreventUpdate()
-    
-    hashed_contents = visualisation.get_hash(pangenome_upload_contents)
-    new_cache_info = visualisation.get_elem_cache_info(int(hashed_contents))
-    return hashed_contents, str(new_cache_info)
- 
\ No newline at end of file
+    alignment = poagraph.get_alignment(dataset_key)
+    fig, selected_vertex = alignment.get_sankey_diagram(zoom_out, slider_values, highlight_seq, click_data, checklist, threshold)
+    return figures.encode_figure(fig, "get_sankey_diagram"), selected_vertex
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="figures", function_name="decode"),
+    Output("poagraph", "figure"),
+    [Input("poagraph_data", "data")])
+
+
+@app.callback(
+    [Output("poagraph-slider", "max"),
+     Output("poagraph-slider", "marks")],
+    [Input("visualisation_session_info", "data")])
+def set_slider(dataset_key):
+    if not dataset_key:
+        return 100, {}
+    return poagraph.get_alignment(dataset_key).set_slider()
+
+
+@app.callback(
+    Output("poagraph-simplifications", "style"),
+    [Input("zoom-out-switch", "on"),
+     Input("poagraph-slider", "value"),
+     Input("visualisation_session_info", "data")])
+def hide_simplifications(zoom_out, slider_values, dataset_key):
+    # A LEVEL OF DETAIL IGNORES THE CHECKLIST, SO IT IS HIDDEN WHENEVER ONE IS DRAWN
+    if not dataset_key or not slider_values:
+        uses_level = zoom_out
+    else:
+        alignment = poagraph.get_alignment(dataset_key)
+        uses_level = bool(alignment.sequences) and alignment.get_window_level(zoom_out, slider_values) is not None
+    return {"visibility": "hidden"} if uses_level else {}
+
+
+@app.callback(
+    Output("full_pangenome_graph", "figure"),
+    [Input("visualisation_session_info", "data"),
+     Input("poagraph-slider", "value")])
+def update_full_pangenome_graph(dataset_key, slider_values):
+    if not dataset_key:
+        raise PreventUpdate()
+    return poagraph.get_alignment(dataset_key).get_gaps_figure(slider_values)
+
+
+@app.callback(
+    Output("gap-shape_x", "data"),
+    [Input("full_pangenome_graph", "relayoutData")],
+    [State("gap-shape_x", "data")])
+def update_gap_shape(relayout_data, shape_x):
+    if not relayout_data or "shapes[0].x0" not in relayout_data:
+        raise PreventUpdate()
+    x0, x1 = sorted([relayout_data["shapes[0].x0"], relayout_data["shapes[0].x1"]])
+    new_shape_x = [int(round(x0)), int(round(x1))]
+    if new_shape_x == shape_x:
+        raise PreventUpdate()
+    return new_shape_x
+
+
+@app.callback(
+    Output("poagraph-slider", "value"),
+    [Input("gap-shape_x", "data")],
+    [State("poagraph-slider", "max")])
+def move_slider(shape_x, slider_max):
+    # THE SANKEY WINDOW FOLLOWS THE RECTANGLE THROUGH THE SLIDER
+    x0 = min(max(shape_x[0], 0), slider_max)
+    x1 = min(max(shape_x[1], x0), slider_max)
+    return [x0, x1]
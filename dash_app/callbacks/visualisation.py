@@ -1,31 +1,25 @@
-import pandas as pd
-import json
-import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output
 from dash.exceptions import PreventUpdate
 
-from dash_app.components import consensustable, consensustree, tools, poagraph
+from dash_app.components import pangenome, poagraph, visualisation
 from dash_app.layout.pages import get_task_description_layout
 from dash_app.server import app
 
 
 @app.callback(
-    [Output("pangenome_hidden", 'children'),
-    #  Output("poagraph_dropdown", "options"),
-     Output("pangviz_load_row", "style")],
+    [Output("pangviz_load_row", "style"),
+     Output("visualisation_session_info", "data")],
     [Input("pangenome_upload", 'contents')])
 def load_visualisation(pangenome_content):
     if not pangenome_content:
         raise PreventUpdate()
 
-    json_data = tools.read_upload(pangenome_content)
-    alignment_object = poagraph.alignment_main_object
-    alignment_object.update_data(json_data)
-    options = [{'label': s, 'value': s} for s in alignment_object.sequences.keys()]
-
-    if pangenome_content.startswith("data:application/json;base64"):
-        return tools.decode_content(pangenome_content), {"visibility": "hidden"}
-    return pangenome_content, {"visibility": "hidden"}
+    dataset_key = visualisation.get_hash(pangenome_content)
+    pangenome.get_pangenome(dataset_key, lambda: pangenome.read_upload(pangenome_content))
+    # A FILE UPLOADED AGAIN, OR IN ANOTHER TAB, REUSES THE REGISTERED ALIGNMENT
+    poagraph.get_alignment(dataset_key)
+    # ONLY THE KEY GOES BACK TO THE BROWSER, CALLBACKS RESOLVE IT TO THE SERVER-SIDE DATASET
+    return {"visibility": "hidden"}, dataset_key
 
 
 @app.callback(
@@ -38,31 +32,28 @@ def show_visualisation(pangenome_content):
 
 
 @app.callback(Output("task_parameters_vis", 'children'),
-              [Input("pangenome_hidden", 'children')])
-def show_task_parameters(jsonified_pangenome):
-    if not jsonified_pangenome:
+              [Input("visualisation_session_info", 'data')])
+def show_task_parameters(dataset_key):
+    if not dataset_key:
         return []
-    jsonpangenome = tools.unjsonify_jsonpangenome(jsonified_pangenome)
-    return get_task_description_layout(jsonpangenome)
+    pangenome_data = pangenome.get_dataset(dataset_key)
+    return get_task_description_layout(pangenome_data.task_parameters,
+                                       len(pangenome_data.node_ids),
+                                       len(pangenome_data.sequences_str_ids),
+                                       len(pangenome_data.affinitytree))
 
 @app.callback(
     Output("poagraph_dropdown", "options"),
-    [Input("consensus_tree_graph", 'clickData')],
-    [State("full_consensustable_hidden", 'children'),
-     State("full_consensustree_hidden", 'children')]
+    [Input("consensus_tree_graph", 'clickData'),
+     Input("visualisation_session_info", "data")]
 )
-def update_poagraph_options(click_data, consensustable_data, consensustree_data):
+def update_poagraph_options(click_data, dataset_key):
+    if not dataset_key:
+        return []
+    alignment_object = poagraph.get_alignment(dataset_key)
     if click_data:
         node_id = click_data['points'][0]['pointIndex']
-        full_consensustable = pd.read_json(consensustable_data)
-        consensustree_data = json.loads(consensustree_data)
-        tree = consensustree.dict_to_tree(consensustree_data)
-        node_details_df = consensustable.get_consensus_details_df(node_id, full_consensustable, tree)
-        options = [{'label': s, 'value': s} for s in node_details_df["SEQID"].tolist()] 
+        options = [{'label': s, 'value': s} for s in alignment_object.get_subset_sequences(node_id)]
     else:
-        alignment_object = poagraph.alignment_main_object
-        if poagraph.alignment_main_object.sequences:
-            options = [{'label': s, 'value': s} for s in alignment_object.sequences.keys()]
-        else:
-            options = []
+        options = [{'label': s, 'value': s} for s in alignment_object.sequences.keys()]
     return options
\ No newline at end of file
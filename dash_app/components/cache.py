@@ -0,0 +1,156 @@
+import os
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Hashable, Optional, Set
+
+import numpy as np
+
+
+def get_nbytes(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """Approximate memory used by obj, counting every NumPy buffer once however many views share it."""
+
+    seen = set() if seen is None else seen
+    if isinstance(obj, np.ndarray):
+        # VIEWS AND ARRAYS LOADED FROM npz FILES ARE BACKED BY ANOTHER ndarray
+        owner = obj
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        if id(owner) in seen:
+            return 0
+        seen.add(id(owner))
+        return owner.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(get_nbytes(k, seen) + get_nbytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(get_nbytes(v, seen) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return get_nbytes(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    """Least recently used cache bounded by the total size of its entries."""
+
+    def __init__(self, max_bytes: int, on_resize: Optional[Callable[[], None]] = None):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        # CALLED AFTER EVERY set, SO AN OWNER CACHED ELSEWHERE CAN REPORT ITS NEW SIZE
+        self.on_resize = on_resize
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def set(self, key: Hashable, value: Any, nbytes: Optional[int] = None) -> None:
+        nbytes = get_nbytes(value) if nbytes is None else nbytes
+        with self.lock:
+            self.pop(key)
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            # THE NEWEST ENTRY STAYS EVEN IF IT ALONE EXCEEDS THE LIMIT
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted_nbytes) = self.entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+        if self.on_resize is not None:
+            self.on_resize()
+
+    def resize(self, key: Hashable, value: Any, nbytes: int) -> None:
+        """New size of the entry, if key still holds value."""
+        with self.lock:
+            if key in self.entries and self.entries[key][0] is value:
+                self.set(key, value, nbytes)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, nbytes = self.entries.pop(key)
+            self.nbytes -= nbytes
+            return value
+
+    def get_or_create(self, key: Hashable, create: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+        return value
+
+
+class DiskCache:
+    """Files named by key in a directory shared by all workers, bounded by their total size.
+
+    Entries are written to a temporary file and renamed, so readers in other
+    processes never see partial files. Access time is tracked by mtime and the
+    least recently used files are removed first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+    def path(self, key: str) -> Path:
+        return self.directory.joinpath(key + self.suffix)
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def set(self, key: str, write: Callable[[BinaryIO], None]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        temporary_path = self.directory.joinpath(f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temporary_path, "wb") as f:
+                write(f)
+            os.replace(temporary_path, path)
+        finally:
+            if temporary_path.exists():
+                temporary_path.unlink()
+        self.evict(keep=path)
+        return path
+
+    def pop(self, key: str) -> None:
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        entries = []
+        for path in self.directory.glob("*" + self.suffix):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        nbytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if nbytes <= self.max_bytes:
+                break
+            # THE NEWEST ENTRY STAYS EVEN IF IT ALONE EXCEEDS THE LIMIT
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            nbytes -= size
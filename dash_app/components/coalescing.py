@@ -0,0 +1,83 @@
+import functools
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Hashable, Optional, Tuple
+
+from dash.exceptions import PreventUpdate
+from flask import has_request_context, session
+
+from dash_app.server import server
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCoalescer:
+    """Latest-wins tickets per page and output, stale requests are dropped."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.latest = dict()
+        self.dropped = Counter()
+        self.tickets = itertools.count()
+        self.lock = threading.Lock()
+
+    def start(self, page_id: Optional[str], output: str) -> Tuple[Hashable, int, bool]:
+        """Ticket of the request and whether an earlier request of the same page and output is still in flight."""
+        # TABS OF ONE BROWSER SHARE THE SESSION COOKIE, EACH RENDERED PAGE HAS ITS OWN ID
+        key = (page_id or get_session_id(), output)
+        ticket = next(self.tickets)
+        with self.lock:
+            in_burst = key in self.latest
+            self.latest[key] = ticket
+        return key, ticket, in_burst
+
+    def finish(self, key: Hashable, ticket: int) -> None:
+        # ONLY REQUESTS IN FLIGHT KEEP AN ENTRY
+        with self.lock:
+            if self.latest.get(key) == ticket:
+                del self.latest[key]
+
+    def check(self, key: Hashable, ticket: int) -> None:
+        with self.lock:
+            if self.latest.get(key) == ticket:
+                return
+            self.dropped[key[1]] += 1
+        logger.info("%s: dropped stale request (%d in total)", key[1], self.dropped[key[1]])
+        raise PreventUpdate()
+
+    def latest_wins(self, output: str) -> Callable:
+        """The decorated callback takes State("page_id", "data") as its last argument, it is not passed on."""
+        def decorator(callback):
+            @functools.wraps(callback)
+            def wrapper(*args):
+                *args, page_id = args
+                key, ticket, in_burst = self.start(page_id, output)
+                try:
+                    # A LONE REQUEST RUNS AT ONCE, INSIDE A BURST OF SLIDER MOVES A NEWER ONE MAY SUPERSEDE IT WHILE IT WAITS
+                    if in_burst and self.delay > 0:
+                        time.sleep(self.delay)
+                        self.check(key, ticket)
+                    result = callback(*args)
+                    # A NEWER REQUEST ARRIVED WHILE THIS ONE WAS RUNNING
+                    self.check(key, ticket)
+                    return result
+                finally:
+                    self.finish(key, ticket)
+            return wrapper
+        return decorator
+
+
+coalescer = RequestCoalescer(delay=server.config["COALESCING_DELAY"])
+
+
+def get_session_id() -> str:
+    if not has_request_context():
+        return ""
+    if "coalescing_id" not in session:
+        session["coalescing_id"] = uuid.uuid4().hex
+    return session["coalescing_id"]
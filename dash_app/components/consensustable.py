@@ -5,43 +5,39 @@ from typing import Dict, List
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 import pandas as pd
 import seaborn as sns
+from dash_table.Format import Format, Scheme
 from dash_app.components import consensustree
+from dash_app.components.pangenome import Pangenome
 from dash_app.layout.colors import colors
 from matplotlib.colors import ColorConverter
 from pangtreebuild.affinity_tree.tree import AffinityNodeID
-from pangtreebuild.serialization.json import PangenomeJSON
 
 
-def get_full_table_data(jsonpangenome: PangenomeJSON) -> pd.DataFrame:
-    if not jsonpangenome.sequences:
+COMPATIBILITY_FORMAT = Format(precision=4, scheme=Scheme.fixed)
+# CONSENSUS COLUMNS SENT TO THE TABLE AT ONCE, THE REST ARE REACHED BY consensuses_table_columns_offset
+CONSENSUS_COLUMNS_WINDOW = 50
+
+
+def get_full_table_data(pangenome: Pangenome) -> pd.DataFrame:
+    """Sequences as rows, metadata columns followed by float32 compatibilities to every consensus."""
+    if not pangenome.sequences_str_ids:
         return pd.DataFrame()
-    if jsonpangenome.affinitytree:
-        all_consensuses_ids = [get_consensus_column_name(c.affinity_node_id) for c in jsonpangenome.affinitytree]
-    else:
-        all_consensuses_ids = []
-    first_consensus = jsonpangenome.sequences[0]
-    consensus_df = pd.DataFrame(columns=["ID", "SEQID"] +
-                                   [*first_consensus.metadata.keys()] +
-                                   all_consensuses_ids)
-    for seq in jsonpangenome.sequences:
-        row = {"ID": seq.sequence_int_id,
-               "SEQID": seq.sequence_str_id}
-        for m, v in seq.metadata.items():
-            row[m] = v
-        for c in jsonpangenome.affinitytree:
-            if seq.sequence_str_id in c.comp_to_all_sequences:
-                row[get_consensus_column_name(c.affinity_node_id)] = get_mapped_compatibility(
-                    c.comp_to_all_sequences[seq.sequence_str_id])
-            else:
-                row[get_consensus_column_name(c.affinity_node_id)] = None
-        consensus_df = consensus_df.append(row, ignore_index=True)
-    return consensus_df
-
-
-def get_mapped_compatibility(compatibility: float) -> str:
-    return "{:.{}f}".format(compatibility, 4)
+    columns = {"ID": pangenome.sequences_int_ids,
+               "SEQID": pangenome.sequences_str_ids}
+    # METADATA KEYS OF THE FIRST SEQUENCE COME FIRST, KEYS MISSING IN OTHER SEQUENCES ARE None
+    metadata_keys = dict.fromkeys(key for metadata in pangenome.sequences_metadata for key in metadata)
+    for key in metadata_keys:
+        columns[key] = [metadata.get(key) for metadata in pangenome.sequences_metadata]
+    # THE FRAME WRAPS THE COMPATIBILITIES MATRIX, METADATA IS INSERTED IN FRONT OF IT WITHOUT A CONCAT COPY
+    full_table = pd.DataFrame(pangenome.compatibilities.T,
+                              columns=[get_consensus_column_name(c["affinity_node_id"]) for c in pangenome.affinitytree],
+                              copy=False)
+    for position, (name, values) in enumerate(columns.items()):
+        full_table.insert(position, name, values)
+    return full_table
 
 
 def get_consensus_column_name(affinity_node_id: AffinityNodeID) -> str:
@@ -70,6 +66,75 @@ def remove_smaller_than_slider(full_consensustable_data: pd.DataFrame, tree: nx.
     return full_consensustable_data.drop(columns_to_hide, axis=1)
 
 
+class ConsensusesVisibility:
+    """Slider interval [lower, upper) in which each consensus column is shown, see remove_smaller_than_slider.
+
+    A consensus is shown when its own mincomp is above the slider and no ancestor's is,
+    so lower is the highest mincomp among its ancestors and upper is its own mincomp.
+    """
+
+    def __init__(self, tree: nx.DiGraph):
+        self.consensuses_ids = np.array(sorted(tree.nodes), dtype=np.int64)
+        self.columns = [get_consensus_column_name(c_id) for c_id in self.consensuses_ids.tolist()]
+        indices = {c_id: i for i, c_id in enumerate(self.consensuses_ids.tolist())}
+        self.upper = np.array([tree.nodes[c_id]['mincomp'] for c_id in self.consensuses_ids.tolist()], dtype=np.float64)
+        self.lower = np.full(len(self.consensuses_ids), -np.inf)
+        nodes_to_visit = deque([0])
+        while nodes_to_visit:
+            current_node_id = nodes_to_visit.pop()
+            for child_id in tree.nodes[current_node_id]['children_consensuses']:
+                if child_id not in indices:
+                    continue
+                self.lower[indices[child_id]] = max(self.lower[indices[current_node_id]], self.upper[indices[current_node_id]])
+                nodes_to_visit.append(child_id)
+        self.lower_order = np.argsort(self.lower, kind="stable")
+        self.upper_order = np.argsort(self.upper, kind="stable")
+        self.sorted_lower = self.lower[self.lower_order]
+        self.sorted_upper = self.upper[self.upper_order]
+
+    def get_mask(self, slider_value: float) -> np.ndarray:
+        from_lower = np.zeros(len(self.consensuses_ids), dtype=bool)
+        from_lower[self.lower_order[:np.searchsorted(self.sorted_lower, slider_value, side="right")]] = True
+        below_upper = np.zeros(len(self.consensuses_ids), dtype=bool)
+        below_upper[self.upper_order[np.searchsorted(self.sorted_upper, slider_value, side="right"):]] = True
+        return from_lower & below_upper
+
+    def get_columns(self, slider_value: float) -> List[str]:
+        return [column for column, shown in zip(self.columns, self.get_mask(slider_value).tolist()) if shown]
+
+
+def get_column_ranks(column: pd.Series) -> np.ndarray:
+    """Dense ranks of the column values, missing values rank after all others.
+
+    Object columns mixing types are ranked by the string form of their values.
+    """
+    try:
+        ranks = column.rank(method="dense")
+    except TypeError:
+        missing = column.isna().to_numpy()
+        codes, _ = pd.factorize(column[~missing].astype(str), sort=True)
+        ranks = pd.Series(np.nan, index=column.index)
+        ranks[~missing] = codes + 1
+    return ranks.fillna(len(column) + 1).to_numpy(dtype=np.int64)
+
+
+def get_rows_order(columns_ranks: List[np.ndarray], columns_orders: List[np.ndarray],
+                   descending: List[bool]) -> np.ndarray:
+    if len(columns_ranks) == 1 and not descending[0]:
+        return columns_orders[0]
+    keys = []
+    for ranks, is_descending in zip(columns_ranks, descending):
+        # MISSING VALUES STAY LAST IN BOTH DIRECTIONS
+        keys.append(np.where(ranks > len(ranks), ranks, -ranks) if is_descending else ranks)
+    return np.lexsort(keys[::-1])
+
+
+def get_columns_window(metadata_columns: List[str], consensus_columns: List[str], offset: int) -> List[str]:
+    # AN OFFSET PAST THE LAST WINDOW SHOWS THE LAST WINDOW
+    offset = min(offset, max(len(consensus_columns) - CONSENSUS_COLUMNS_WINDOW, 0))
+    return metadata_columns + consensus_columns[offset:offset+CONSENSUS_COLUMNS_WINDOW]
+
+
 def hide_children(consensus_tree, parent_id):
     nodes_to_visit = deque(consensus_tree.nodes[parent_id]['children_consensuses'])
     while nodes_to_visit:
@@ -94,18 +159,26 @@ def get_cells_styling(tree: nx.DiGraph, partial_consensustable_data: pd.DataFram
     for consensus_colname in consensuses_colnames:
         consensus_id = int(consensus_colname[9:])
         consensus_mincomp = tree.nodes[consensus_id]['mincomp']
-        styling_conditions.append(get_cell_styling_dict(consensus_colname, get_mapped_compatibility(consensus_mincomp)))
+        # CELLS ARE float32, A COMPATIBILITY EQUAL TO mincomp MUST NOT ROUND BELOW IT
+        styling_conditions.append(get_cell_styling_dict(consensus_colname, float(np.float32(consensus_mincomp))))
     return styling_conditions
 
 
-def get_cell_styling_dict(consensus_colname, mincomp):
+def get_cell_styling_dict(consensus_colname: str, mincomp: float) -> Dict:
     return {
         'if': {'column_id': f'{consensus_colname}',
-               'filter_query': f'{consensus_colname} >= "{mincomp}"'},
+               'filter_query': f'{{{consensus_colname}}} >= {mincomp!r}'},
         'backgroundColor': "silver"
     }
 
 
+def get_table_columns(consensustable_data: pd.DataFrame) -> List[Dict]:
+    # COMPATIBILITIES ARE FORMATTED BY THE TABLE, THE DATA STAYS NUMERIC
+    return [{"name": i, "id": i, "type": "numeric", "format": COMPATIBILITY_FORMAT} if "CONSENSUS" in i
+            else {"name": i, "id": i}
+            for i in consensustable_data.columns]
+
+
 def get_node_distribution_fig(node_id: AffinityNodeID, full_consensustable: pd.DataFrame):
     x = full_consensustable[get_consensus_column_name(node_id)]
     plt.figure()
@@ -8,35 +8,37 @@ import numpy as np
 import pandas as pd
 
 from pangtreebuild.affinity_tree.tree import AffinityNodeID
-from pangtreebuild.serialization.json import PangenomeJSON, AffinityNode
+from pangtreebuild.serialization.json import AffinityNode
 import networkx as nx
 from networkx.readwrite import json_graph
 
+from dash_app.components.pangenome import Pangenome
 
-def get_consensustree_dict(jsonpangenome: PangenomeJSON) -> Dict:
-    tree = get_consensustree(jsonpangenome)
+
+def get_consensustree_dict(pangenome: Pangenome) -> Dict:
+    tree = get_consensustree(pangenome)
     tree_dict = tree_to_dict(tree)
     return tree_dict
 
 
-def get_consensustree(jsonpangenome: PangenomeJSON) -> nx.DiGraph:
+def get_consensustree(pangenome: Pangenome) -> nx.DiGraph:
     tree_graph = nx.DiGraph()
-    for consensus in sorted(jsonpangenome.affinitytree, key=lambda c: c.affinity_node_id):
-        node_is_leaf = True if not consensus.children else False
+    for consensus in sorted(pangenome.affinitytree, key=lambda c: c["affinity_node_id"]):
+        node_is_leaf = True if not consensus["children"] else False
+        sequences_ids = consensus["sequences_int_ids"].tolist()
         tree_graph.add_node(
-            consensus.affinity_node_id,
-            name=consensus.name,
-            comp=consensus.comp_to_all_sequences,
-            sequences_ids=consensus.sequences_int_ids,
+            consensus["affinity_node_id"],
+            name=consensus["name"],
+            sequences_ids=sequences_ids,
             show_in_table=True,
             hidden=False,
-            children_consensuses=consensus.children,
+            children_consensuses=consensus["children"],
             # mincomp=consensus.mincomp ** (1/jsonpangenome.program_parameters.p),
-            mincomp=consensus.mincomp,
+            mincomp=consensus["mincomp"],
             is_leaf=node_is_leaf
         )
-        if consensus.parent is not None:
-            tree_graph.add_edge(consensus.parent, consensus.affinity_node_id, weight=len(consensus.sequences_int_ids))
+        if consensus["parent"] is not None:
+            tree_graph.add_edge(consensus["parent"], consensus["affinity_node_id"], weight=len(sequences_ids))
 
     return tree_graph
 
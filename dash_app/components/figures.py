@@ -0,0 +1,60 @@
+import base64
+import json
+import logging
+from numbers import Number
+from typing import Any, Dict
+
+import numpy as np
+import plotly.graph_objs as go
+from plotly.utils import PlotlyJSONEncoder
+
+
+logger = logging.getLogger(__name__)
+
+# SHORTER ARRAYS COST MORE TO DESCRIBE THAN TO SEND AS JSON
+MIN_ENCODED_LENGTH = 16
+MAX_PALETTE_SIZE = 255
+
+
+def encode_array(values: np.ndarray, dtype: str) -> Dict[str, str]:
+    """Typed array in the plotly.js {dtype, bdata} form, decoded by assets/figures.js."""
+    return dict(dtype=dtype, bdata=base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode("ascii"))
+
+
+def encode_values(values: Any) -> Any:
+    if isinstance(values, dict):
+        return {key: encode_values(value) for key, value in values.items()}
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind in "iu" and len(values) >= MIN_ENCODED_LENGTH:
+            return encode_array(values, "<i4")
+        if values.dtype.kind == "f" and len(values) >= MIN_ENCODED_LENGTH:
+            return encode_array(values, "<f4")
+        values = values.tolist()
+    if not isinstance(values, (list, tuple)):
+        return values
+    if len(values) < MIN_ENCODED_LENGTH:
+        return [encode_values(value) for value in values]
+    if all(value is None or isinstance(value, Number) and not isinstance(value, bool) for value in values):
+        if all(isinstance(value, (int, np.integer)) for value in values):
+            return encode_array(values, "<i4")
+        # NaN BREAKS LINES WHERE None DID
+        return encode_array([np.nan if value is None else value for value in values], "<f4")
+    if all(isinstance(value, str) for value in values):
+        palette, indices = np.unique(values, return_inverse=True)
+        if len(palette) <= MAX_PALETTE_SIZE and 2 * len(palette) <= len(values):
+            return dict(palette=palette.tolist(), indices=encode_array(indices.ravel(), "<u1"))
+    return [encode_values(value) for value in values]
+
+
+def encode_figure(figure: go.Figure, callback_name: str) -> Dict[str, Any]:
+    """Figure with its trace arrays packed for the figures.decode clientside callback."""
+    figure_json = figure.to_plotly_json()
+    payload = dict(
+        data=[encode_values(trace) for trace in figure_json["data"]],
+        layout=figure_json["layout"],
+    )
+    # SERIALIZING THE PAYLOAD ONLY TO MEASURE IT WOULD COST EVERY SLIDER TICK
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s payload: %d bytes (%d bytes as plain JSON)", callback_name,
+                     len(json.dumps(payload, cls=PlotlyJSONEncoder)), len(figure.to_json()))
+    return payload
@@ -0,0 +1,358 @@
+"""Streaming reader of pangenome.json into compact arrays.
+
+The JSON text is decoded chunk by chunk and parsed one array element at a
+time, so the full dict tree is never built. Peak memory while loading is
+roughly the input string, one CHUNK_SIZE chunk, the largest single element
+(usually one sequence) and the output arrays:
+
+- paths: 4 bytes per sequence step (int32) instead of a Python int in a list
+  (~36 bytes) plus its JSON text,
+- nodes: 32 bytes per node while reading (three int64 fields and a pointer to
+  an interned base), 16 bytes once packed into int32 and '<U1' arrays,
+- compatibilities: 4 bytes per (affinity tree node, sequence) pair (float32).
+
+Parsed pangenomes are kept on disk as uncompressed npz files named by the
+SHA-256 of the upload, so reopening a dataset from any worker or after a
+restart skips parsing.
+"""
+import base64
+import codecs
+import json
+import logging
+import re
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dash.exceptions import PreventUpdate
+from pangtreebuild.serialization.json import TaskParameters
+
+from dash_app.components import cache
+from dash_app.server import server
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+CACHE_FORMAT = 1
+TREE_ARRAYS = ("nodes_ids", "sequences_int_ids")
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONStream:
+    """Incremental reader over chunks of JSON text, decoding one value at a time."""
+
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: int) -> bool:
+        # AT LEAST size CHARACTERS AFTER position, UNLESS THE INPUT ENDS FIRST
+        parts = [self.buffer[self.position:]]
+        length = len(parts[0])
+        while length < size and not self.exhausted:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        self.buffer = "".join(parts)
+        self.position = 0
+        return length >= size
+
+    def peek(self) -> str:
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill(1):
+                raise ValueError("Unexpected end of JSON input")
+
+    def expect(self, character: str) -> None:
+        if self.peek() != character:
+            raise ValueError(f"Expected '{character}' at JSON input position {self.position}")
+        self.position += 1
+
+    def read_value(self):
+        self.peek()
+        size = CHUNK_SIZE
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A NUMBER AT THE BUFFER END MAY CONTINUE IN THE NEXT CHUNK
+                if end < len(self.buffer) or self.exhausted:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self._fill(len(self.buffer) - self.position + size)
+            size *= 2
+
+    def iter_object(self) -> Iterator[str]:
+        """Yields the keys, the caller reads every value before the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.position += 1
+                continue
+            self.expect("}")
+            return
+
+    def iter_array(self) -> Iterator:
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.read_value()
+            if self.peek() == ",":
+                self.position += 1
+                continue
+            self.expect("]")
+            return
+
+
+class Pangenome:
+    def __init__(self):
+        self.task_parameters = TaskParameters()
+        self.node_ids = None
+        self.node_bases = None
+        self.node_columns = None
+        self.node_blocks = None
+        self.sequences_str_ids = []
+        self.sequences_int_ids = None
+        self.sequences_metadata = []
+        self.paths = None
+        self.paths_offsets = None
+        # AFFINITY TREE NODES WITHOUT THEIR COMPATIBILITIES, ids ARE NUMPY ARRAYS
+        self.affinitytree = []
+        # ROW i HOLDS COMPATIBILITIES OF affinitytree[i] TO ALL SEQUENCES, IN SEQUENCES ORDER
+        self.compatibilities = None
+
+
+def iter_text(text: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start+chunk_size]
+
+
+def iter_upload_text(content: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    # BASE64 DECODES IN GROUPS OF 4 CHARACTERS
+    chunk_size -= chunk_size % 4
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for start in range(content.index(",")+1, len(content), chunk_size):
+        yield decoder.decode(base64.b64decode(content[start:start+chunk_size]))
+    yield decoder.decode(b"", final=True)
+
+
+def read_pangenome(chunks: Iterable[str]) -> Pangenome:
+    stream = JSONStream(chunks)
+    pangenome = Pangenome()
+    compatibilities = []
+    for key in stream.iter_object():
+        if key == "nodes":
+            read_nodes(pangenome, stream.iter_array())
+        elif key == "sequences":
+            read_sequences(pangenome, stream.iter_array())
+        elif key == "affinitytree":
+            compatibilities = read_affinitytree(pangenome, stream.iter_array())
+        elif key == "task_parameters":
+            pangenome.task_parameters = get_task_parameters(stream.read_value())
+        else:
+            stream.read_value()
+
+    # AFFINITY TREE MAY COME BEFORE SEQUENCES IN THE FILE
+    sequences_indices = {sequence_id: i for i, sequence_id in enumerate(pangenome.sequences_str_ids)}
+    # NaN WHERE A NODE HAS NO COMPATIBILITY TO A SEQUENCE
+    pangenome.compatibilities = np.full((len(compatibilities), len(sequences_indices)), np.nan, dtype=np.float32)
+    order, order_indices = None, None
+    for row, (sequences_ids, values) in zip(pangenome.compatibilities, compatibilities):
+        if sequences_ids is not order:
+            order = sequences_ids
+            order_indices = np.array([sequences_indices[sequence_id] for sequence_id in order], dtype=np.int64)
+        row[order_indices] = values
+    return pangenome
+
+
+def get_task_parameters(values: Dict) -> TaskParameters:
+    # SAME AS pangtreebuild's str_to_PangenomeJSON, KEYS ARE THE ATTRIBUTE NAMES
+    task_parameters = TaskParameters()
+    task_parameters.__dict__.update(values)
+    return task_parameters
+
+
+def read_upload(content: str) -> Pangenome:
+    return read_pangenome(iter_upload_text(content))
+
+
+def read_text(text: str) -> Pangenome:
+    return read_pangenome(iter_text(text))
+
+
+def read_nodes(pangenome: Pangenome, nodes: Iterator[dict]) -> None:
+    ids, columns, blocks, bases = array("l"), array("l"), array("l"), []
+    for node in nodes:
+        ids.append(node["id"])
+        columns.append(node["column_id"])
+        blocks.append(node["block_id"])
+        bases.append(node["base"])
+    order = np.argsort(np.frombuffer(ids, dtype=np.int_), kind="stable")
+    pangenome.node_ids = np.frombuffer(ids, dtype=np.int_)[order].astype(np.int32)
+    pangenome.node_columns = np.frombuffer(columns, dtype=np.int_)[order].astype(np.int32)
+    pangenome.node_blocks = np.frombuffer(blocks, dtype=np.int_)[order].astype(np.int32)
+    pangenome.node_bases = np.array(bases)[order]
+
+
+def read_sequences(pangenome: Pangenome, sequences: Iterator[dict]) -> None:
+    int_ids, paths = array("l"), []
+    for sequence in sequences:
+        pangenome.sequences_str_ids.append(sequence["sequence_str_id"])
+        pangenome.sequences_metadata.append(sequence.get("metadata", {}))
+        int_ids.append(sequence["sequence_int_id"])
+        paths.append(np.array(sequence["nodes_ids"][0], dtype=np.int32))
+    pangenome.sequences_int_ids = np.frombuffer(int_ids, dtype=np.int_).astype(np.int64)
+    pangenome.paths_offsets = np.zeros(len(paths)+1, dtype=np.int64)
+    np.cumsum([len(path) for path in paths], out=pangenome.paths_offsets[1:])
+    pangenome.paths = np.concatenate(paths) if paths else np.zeros(0, dtype=np.int32)
+
+
+def read_affinitytree(pangenome: Pangenome, nodes: Iterator[dict]) -> list:
+    compatibilities = []
+    previous_ids: Optional[list] = None
+    for node in nodes:
+        comp_to_all_sequences = node.pop("comp_to_all_sequences", {})
+        sequences_ids = list(comp_to_all_sequences)
+        # CONSECUTIVE NODES SHARE ONE KEY LIST WHEN THEIR SEQUENCES ORDER IS THE SAME
+        if sequences_ids == previous_ids:
+            sequences_ids = previous_ids
+        previous_ids = sequences_ids
+        compatibilities.append((sequences_ids, np.fromiter(comp_to_all_sequences.values(), dtype=np.float32, count=len(sequences_ids))))
+        node["nodes_ids"] = np.array(node.get("nodes_ids", []), dtype=np.int32)
+        node["sequences_int_ids"] = np.array(node.get("sequences_int_ids", []), dtype=np.int64)
+        pangenome.affinitytree.append(node)
+    return compatibilities
+
+
+datasets = cache.DiskCache(server.config["DATASETS_CACHE_DIR"], server.config["DATASETS_CACHE_LIMIT"], ".npz")
+pangenomes = cache.LRUCache(max_bytes=server.config["PANGENOMES_MEMORY_LIMIT"])
+# UPLOADS PARSED PER DATASET KEY, EXPECTED TO STAY AT 1 UNTIL EVICTED FROM BOTH CACHES
+parses = Counter()
+loading_locks = defaultdict(threading.Lock)
+loading_locks_lock = threading.Lock()
+
+
+def pack(arrays: List[np.ndarray], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(arrays)+1, dtype=np.int64)
+    np.cumsum([len(values) for values in arrays], out=offsets[1:])
+    values = np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+    return values, offsets
+
+
+def unpack(values: np.ndarray, offsets: np.ndarray) -> List[np.ndarray]:
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def save(pangenome: Pangenome, f: BinaryIO) -> None:
+    meta = dict(
+        format=CACHE_FORMAT,
+        task_parameters=vars(pangenome.task_parameters),
+        sequences_str_ids=pangenome.sequences_str_ids,
+        sequences_metadata=pangenome.sequences_metadata,
+        affinitytree=[{key: value for key, value in node.items() if key not in TREE_ARRAYS}
+                      for node in pangenome.affinitytree],
+    )
+    tree_arrays = dict()
+    for name, dtype in zip(TREE_ARRAYS, (np.int32, np.int64)):
+        tree_arrays[name], tree_arrays[name + "_offsets"] = pack([node[name] for node in pangenome.affinitytree], dtype)
+    np.savez(
+        f,
+        meta=np.array(json.dumps(meta)),
+        node_ids=pangenome.node_ids,
+        node_bases=pangenome.node_bases,
+        node_columns=pangenome.node_columns,
+        node_blocks=pangenome.node_blocks,
+        sequences_int_ids=pangenome.sequences_int_ids,
+        paths=pangenome.paths,
+        paths_offsets=pangenome.paths_offsets,
+        compatibilities=pangenome.compatibilities,
+        **{"tree_" + name: values for name, values in tree_arrays.items()},
+    )
+
+
+def load(path) -> Pangenome:
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].item())
+        if meta["format"] != CACHE_FORMAT:
+            raise ValueError(f"Unsupported pangenome cache format {meta['format']}")
+        pangenome = Pangenome()
+        pangenome.task_parameters = get_task_parameters(meta["task_parameters"])
+        pangenome.sequences_str_ids = meta["sequences_str_ids"]
+        pangenome.sequences_metadata = meta["sequences_metadata"]
+        pangenome.node_ids = data["node_ids"]
+        pangenome.node_bases = data["node_bases"]
+        pangenome.node_columns = data["node_columns"]
+        pangenome.node_blocks = data["node_blocks"]
+        pangenome.sequences_int_ids = data["sequences_int_ids"]
+        pangenome.paths = data["paths"]
+        pangenome.paths_offsets = data["paths_offsets"]
+        pangenome.compatibilities = data["compatibilities"]
+        pangenome.affinitytree = meta["affinitytree"]
+        for name in TREE_ARRAYS:
+            for node, values in zip(pangenome.affinitytree, unpack(data["tree_" + name], data["tree_" + name + "_offsets"])):
+                node[name] = values
+    return pangenome
+
+
+def get_pangenome(dataset_key: str, read: Callable[[], Pangenome]) -> Pangenome:
+    """Pangenome shared by all callbacks of a dataset, read from memory, disk or by read()."""
+    pangenome = pangenomes.get(dataset_key)
+    if pangenome is not None:
+        return pangenome
+    with loading_locks_lock:
+        loading_lock = loading_locks[dataset_key]
+    # CALLBACKS FIRED BY ONE UPLOAD WAIT FOR THE FIRST ONE INSTEAD OF PARSING AGAIN
+    with loading_lock:
+        pangenome = pangenomes.get(dataset_key)
+        if pangenome is None:
+            pangenome = load_or_read(dataset_key, read)
+            pangenomes.set(dataset_key, pangenome)
+    with loading_locks_lock:
+        loading_locks.pop(dataset_key, None)
+    return pangenome
+
+
+def load_or_read(dataset_key: str, read: Callable[[], Pangenome]) -> Pangenome:
+    path = datasets.get(dataset_key)
+    if path is not None:
+        try:
+            return load(path)
+        except (OSError, ValueError, KeyError):
+            # EVICTED BY ANOTHER WORKER OR WRITTEN BY AN OLDER VERSION
+            datasets.pop(dataset_key)
+    pangenome = read()
+    parses[dataset_key] += 1
+    logger.info("Parsed pangenome %s (%d times)", dataset_key, parses[dataset_key])
+    try:
+        datasets.set(dataset_key, lambda f: save(pangenome, f))
+    except OSError:
+        logger.warning("Could not cache pangenome %s on disk", dataset_key, exc_info=True)
+    return pangenome
+
+
+def get_dataset(dataset_key: str) -> Pangenome:
+    """Pangenome of a loaded dataset, the upload has to be sent again once both caches evicted it."""
+    def read():
+        raise PreventUpdate()
+    return get_pangenome(dataset_key, read)
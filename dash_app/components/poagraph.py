@@ -1,142 +1,681 @@
-import copy
-import json
+import itertools
+import multiprocessing
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import dash
-from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
-import pandas as pd
+import numpy as np
 import plotly.graph_objs as go
 
-from dash_app.components import consensustable, consensustree, tools
-from dash_app.server import app
+from dash_app.components import cache, pangenome, tools
+from dash_app.components.pangenome import Pangenome
+from dash_app.server import server
 
 
-class Node:
-    def __init__(self, idx: int, base: str, column: int):
-        self.id = idx
-        self.base = base
-        self.column = column
-        
-    def __repr__(self):
-        return f"{self.base} ID: {self.id}, COLUMN: {self.column}"
+BITS_COUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1, dtype=np.uint8)
+BASE_COLORS = dict(A="#FF9AA2", C="#B5EAD7", G="#C7CEEA", T="#FFDAC1")
+LINK_COLOR = "#D3D3D3"
+HIGHLIGHT_COLORS = ["#342424", "#1F77B4", "#D62728", "#2CA02C", "#9467BD", "#8C564B", "#E377C2", "#17BECF"]
+SANKEY_NODES_LIMIT = 2000
+LEVEL_WIDTH_FACTOR = 4
+LEVEL_MIN_WEIGHT = 0.2
+OVERVIEW_BINS = 1000
+CHAINS_MEMORY_LIMIT = 64 * 1024**2
+TILE_COLUMNS = 256
+TILES_MEMORY_LIMIT = 64 * 1024**2
+STAGES_MEMORY_LIMIT = 64 * 1024**2
+# EDGES WHOSE BITSETS ARE MASKED AT ONCE WHEN THE WHOLE GRAPH IS FILTERED BY A SUBSET
+EDGES_CHUNK_SIZE = 64 * 1024
+
+
+class Diagram:
+    def __init__(self, sources, targets, weights, sequences_bits, nodes_count):
+        self.sources = sources
+        self.targets = targets
+        self.weights = weights
+        # ROW i HOLDS THE PACKED SET OF SEQUENCES TRAVERSING EDGE i
+        self.sequences_bits = sequences_bits
+        # EDGES ARE SORTED BY SOURCE, SO EVERY NODE RANGE OWNS A CONTIGUOUS SLICE OF THEM
+        self.sources_offsets = np.searchsorted(sources, np.arange(nodes_count+1))
+        self.targets_order = np.argsort(targets, kind="stable")
+        self.targets_offsets = np.searchsorted(targets[self.targets_order], np.arange(nodes_count+1))
+
+    def outgoing(self, range_start, range_end, subset_bits=None):
+        edges = np.arange(self.sources_offsets[range_start], self.sources_offsets[range_end+1])
+        return self.get_edges(edges, subset_bits)
+
+    def outgoing_of(self, nodes, subset_bits=None):
+        starts = self.sources_offsets[nodes]
+        counts = self.sources_offsets[nodes+1] - starts
+        edges = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return self.get_edges(edges, subset_bits)
+
+    def incoming(self, range_start, range_end, subset_bits=None):
+        edges = self.targets_order[self.targets_offsets[range_start]:self.targets_offsets[range_end+1]]
+        return self.get_edges(edges, subset_bits)
+
+    def get_edges(self, edges, subset_bits=None):
+        if subset_bits is None:
+            return self.sources[edges], self.targets[edges], self.weights[edges]
+        weights = BITS_COUNT[self.sequences_bits[edges] & subset_bits].sum(axis=1, dtype=np.int32)
+        edges, weights = edges[weights > 0], weights[weights > 0]
+        return self.sources[edges], self.targets[edges], weights
+
+    def traversed_by(self, subset_bits):
+        """Mask of the edges traversed by at least one sequence of the subset, nothing is counted."""
+        traversed = np.empty(len(self.sources), dtype=bool)
+        for start in range(0, len(self.sources), EDGES_CHUNK_SIZE):
+            np.any(self.sequences_bits[start:start+EDGES_CHUNK_SIZE] & subset_bits, axis=1,
+                   out=traversed[start:start+EDGES_CHUNK_SIZE])
+        return traversed
+
+
+def remove_snp(paths, offsets, consensus, consensus_positions):
+    lengths = np.diff(offsets)
+    positions = np.arange(len(paths))
+    in_sequence_positions = positions - np.repeat(offsets[:-1], lengths)
+    inner = (in_sequence_positions > 0) & (in_sequence_positions < np.repeat(lengths, lengths) - 1)
+    node_positions = consensus_positions[paths]
+    before = np.roll(node_positions, 1)
+    after = np.roll(node_positions, -1)
+
+    # SUBSTITUTION AND INSERTION
+    bubble = inner & (node_positions < 0) & (before >= 0) & (after >= 0)
+    insertion = bubble & (after-before == 1)
+    substitution = bubble & (after-before == 2)
+    # DELETION
+    deletion = inner & (node_positions >= 0) & (after >= 0) & (after-node_positions == 2)
+
+    filtered_paths = paths.copy()
+    filtered_paths[substitution] = consensus[before[substitution] + 1]
+    counts = np.ones(len(paths), dtype=np.int64)
+    counts[insertion] = 0
+    counts[deletion] = 2
+    filtered_positions = np.zeros(len(paths)+1, dtype=np.int64)
+    np.cumsum(counts, out=filtered_positions[1:])
+    filtered_paths = np.repeat(filtered_paths, counts)
+    filtered_paths[filtered_positions[:-1][deletion] + 1] = consensus[node_positions[deletion] + 1]
+    return filtered_paths, filtered_positions[offsets]
+
+
+def count_edges(paths, offsets, nodes_count):
+    lengths = np.diff(offsets)
+    positions = np.arange(len(paths))
+    in_sequence_positions = positions - np.repeat(offsets[:-1], lengths)
+    sources_positions = positions[in_sequence_positions < np.repeat(lengths, lengths) - 2]
+    # ENCODE (SOURCE, TARGET) PAIRS AND COUNT THEM IN ONE PASS
+    edges = paths[sources_positions].astype(np.int64) * nodes_count + paths[sources_positions + 1]
+    edges, edges_indices, weights = np.unique(edges, return_inverse=True, return_counts=True)
+    sequences_indices = np.repeat(np.arange(len(lengths)), lengths)[sources_positions]
+    sequences_bits = np.zeros((len(edges), (len(lengths)+7)//8), dtype=np.uint8)
+    np.bitwise_or.at(
+        sequences_bits,
+        (edges_indices, sequences_indices // 8),
+        (128 >> (sequences_indices % 8)).astype(np.uint8)
+    )
+    return edges, weights, sequences_bits
+
+
+def _count_shard_edges(shared_paths_name, paths_count, offsets, nodes_count):
+    from multiprocessing import shared_memory
+    shared_paths = shared_memory.SharedMemory(name=shared_paths_name)
+    try:
+        paths = np.ndarray((paths_count,), dtype=np.int32, buffer=shared_paths.buf)
+        shard = count_edges(paths[offsets[0]:offsets[-1]], offsets - offsets[0], nodes_count)
+        del paths
+        return shard
+    finally:
+        shared_paths.close()
+
+
+def count_edges_parallel(paths, offsets, nodes_count, workers):
+    # SHARED MEMORY NEEDS PYTHON 3.8, SERIAL BUILDS RUN ON 3.6
+    from multiprocessing import shared_memory
+    sequences_count = len(offsets)-1
+    bytes_count = (sequences_count+7)//8
+    # SHARDS START ON WHOLE BYTES, SO THEIR BITSETS ARE PLAIN COLUMN SLICES OF THE MERGED ONE
+    borders = np.minimum(np.linspace(0, bytes_count, workers+1).astype(np.int64) * 8, sequences_count)
+    shared_paths = shared_memory.SharedMemory(create=True, size=max(paths.nbytes, 1))
+    try:
+        np.ndarray(paths.shape, dtype=np.int32, buffer=shared_paths.buf)[:] = paths
+        # FORKING A MULTI-THREADED SERVER PROCESS CAN COPY HELD LOCKS INTO THE CHILDREN
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("forkserver")) as pool:
+            shards = list(pool.map(
+                _count_shard_edges,
+                [shared_paths.name] * workers,
+                [len(paths)] * workers,
+                [offsets[start:end+1] for start, end in zip(borders[:-1], borders[1:])],
+                [nodes_count] * workers,
+            ))
+    finally:
+        shared_paths.close()
+        shared_paths.unlink()
+
+    edges = np.unique(np.concatenate([shard_edges for shard_edges, _, _ in shards]))
+    weights = np.zeros(len(edges), dtype=np.int64)
+    sequences_bits = np.zeros((len(edges), bytes_count), dtype=np.uint8)
+    for (shard_edges, shard_weights, shard_bits), start in zip(shards, borders[:-1].tolist()):
+        edges_indices = np.searchsorted(edges, shard_edges)
+        weights[edges_indices] += shard_weights
+        sequences_bits[edges_indices, start//8:start//8+shard_bits.shape[1]] = shard_bits
+    return edges, weights, sequences_bits
+
+
+def get_edges(paths, offsets, nodes_count, workers=1):
+    if workers > 1:
+        edges, weights, sequences_bits = count_edges_parallel(paths, offsets, nodes_count, workers)
+    else:
+        edges, weights, sequences_bits = count_edges(paths, offsets, nodes_count)
+    return Diagram(
+        sources=(edges // nodes_count).astype(np.int32),
+        targets=(edges % nodes_count).astype(np.int32),
+        weights=weights.astype(np.int32),
+        sequences_bits=sequences_bits,
+        nodes_count=nodes_count,
+    )
+
+
+def prune_weak_connections(outgoing, incoming, range_start, range_end, threshold):
+    """Masks of the outgoing and incoming window edges kept after removal of weak connections."""
+    out_sources, out_targets, out_weights = outgoing
+    in_sources, in_targets, in_weights = incoming
+    nodes_count = range_end-range_start+1
+    out_sources, out_targets = out_sources-range_start, out_targets-range_start
+    in_sources, in_targets = in_sources-range_start, in_targets-range_start
+    # EDGES ARE GROUPED BY THEIR WINDOW NODE, NODE IDS ARE TOPOLOGICALLY ORDERED
+    out_offsets = np.searchsorted(out_sources, np.arange(nodes_count+1)).tolist()
+    in_offsets = np.searchsorted(in_targets, np.arange(nodes_count+1)).tolist()
+    out_strong = out_weights > threshold
+    in_strong = in_weights > threshold
+
+    # FORWARD: ALL INCOMING EDGES ARE BELOW THRESHOLD OR ALL COME FROM WEAK NODES
+    in_degree = np.bincount(in_targets, minlength=nodes_count).tolist()
+    strong_sources = np.bincount(in_targets[in_strong], minlength=nodes_count).tolist()
+    weak_sources = [0]*nodes_count
+    out_targets_list = out_targets.tolist()
+    weak = set()
+    for node in range(nodes_count):
+        if in_degree[node] and (not strong_sources[node] or weak_sources[node] == in_degree[node]):
+            weak.add(node)
+            for edge in range(out_offsets[node], out_offsets[node+1]):
+                if out_targets_list[edge] < nodes_count:
+                    weak_sources[out_targets_list[edge]] += 1
+    forward_weak = np.zeros(nodes_count+1, dtype=bool)
+    forward_weak[list(weak)] = True
+
+    # BACKWARD: ALL STRONG OUTGOING EDGES LEAD TO WEAK NODES (WINDOW BORDERS ARE SKIPPED)
+    out_in_window = np.minimum(out_targets, nodes_count)
+    strong_targets = np.bincount(out_sources[out_strong], minlength=nodes_count).tolist()
+    weak_targets = np.bincount(out_sources[out_strong & forward_weak[out_in_window]], minlength=nodes_count).tolist()
+    in_sources_list = in_sources.tolist()
+    in_strong_list = in_strong.tolist()
+    for node in range(nodes_count-2, 0, -1):
+        if node not in weak and strong_targets[node] and weak_targets[node] == strong_targets[node]:
+            weak.add(node)
+            for edge in range(in_offsets[node], in_offsets[node+1]):
+                if in_sources_list[edge] >= 0 and in_strong_list[edge]:
+                    weak_targets[in_sources_list[edge]] += 1
+    all_weak = np.zeros(nodes_count+1, dtype=bool)
+    all_weak[list(weak)] = True
+
+    # INNER NODES ALSO DROP EDGES TO WEAK TARGETS AND FROM FORWARD-WEAK SOURCES
+    inner_out = (out_sources > 0) & (out_sources < nodes_count-1)
+    inner_in = (in_targets > 0) & (in_targets < nodes_count-1)
+    out_kept = out_strong & ~all_weak[out_sources] & ~(inner_out & all_weak[out_in_window])
+    in_kept = in_strong & ~all_weak[in_targets] & ~(inner_in & forward_weak[np.where(in_sources >= 0, in_sources, nodes_count)])
+    return out_kept, in_kept
+
+
+def get_path_window(path, range_start, range_end):
+    # PATHS ARE TOPOLOGICALLY SORTED, SO THE WINDOW IS A SLICE FOUND BY BINARY SEARCH
+    # THE FIRST NODE PAST THE WINDOW ENDS THE LAST LINK
+    start = np.searchsorted(path, range_start)
+    end = np.searchsorted(path, range_end, side="right")
+    return path[start:end+1]
+
+
+def highlight_links(sources, targets, weights, paths, nodes_count):
+    """Splits a unit link of its own colour off every link passed by a highlighted path."""
+    links = sources.astype(np.int64) * nodes_count + targets
+    weights = weights.copy()
+    split_sources, split_targets, split_weights = [sources], [targets], [weights]
+    link_color = [np.full(len(sources), LINK_COLOR, dtype=object)]
+    for path, color in paths:
+        highlighted = np.isin(links, path[:-1].astype(np.int64) * nodes_count + path[1:])
+        weights[highlighted] -= 1
+        split_sources.append(sources[highlighted])
+        split_targets.append(targets[highlighted])
+        split_weights.append(np.ones(highlighted.sum(), dtype=weights.dtype))
+        link_color.append(np.full(highlighted.sum(), color, dtype=object))
+    return (
+        np.concatenate(split_sources),
+        np.concatenate(split_targets),
+        np.concatenate(split_weights),
+        np.concatenate(link_color),
+    )
+
+
+def get_ranks(columns, order):
+    # POSITION OF EVERY NODE AMONG THE NODES OF ITS COLUMN, order LISTS NODES COLUMN BY COLUMN
+    ranks = np.empty(len(order), dtype=np.int32)
+    sorted_columns = columns[order]
+    ranks[order] = np.arange(len(order)) - np.searchsorted(sorted_columns, sorted_columns)
+    return ranks
+
+
+def get_positions(columns, ranks):
+    # COLUMNS SPREAD OVER THE WIDTH, RANKS DOWN THE HEIGHT
+    if not len(columns):
+        return [], []
+    x = (columns - columns.min()) / max(columns.max() - columns.min(), 1)
+    y = ranks / max(ranks.max(), 1)
+    return (0.01 + 0.98 * x).tolist(), (0.01 + 0.98 * y).tolist()
+
+
+class Level:
+    def __init__(self, width, first_columns, last_columns, labels, paths, offsets, diagram):
+        self.width = width
+        self.first_columns = first_columns
+        self.last_columns = last_columns
+        self.labels = labels
+        self.paths = paths
+        self.offsets = offsets
+        self.diagram = diagram
+        # HEAVIEST NODE OF EVERY COLUMN ON TOP
+        weights = np.bincount(paths, minlength=len(labels))
+        self.ranks = get_ranks(first_columns, np.lexsort((-weights, first_columns)))
+
+    def get_nodes(self, column_start, column_end):
+        # A LONG CHAIN MAY START BEFORE A SHORTER ONE AND STILL REACH THE WINDOW, SO THE IDS ARE NOT A RANGE
+        return np.flatnonzero((self.first_columns <= column_end) & (self.last_columns >= column_start))
+
+
+def get_chains_roots(sources, targets, nodes_count):
+    # u -> v BELONGS TO A CHAIN WHEN IT IS THE ONLY EDGE LEAVING u AND THE ONLY ONE ENTERING v
+    linear = (np.bincount(sources, minlength=nodes_count)[sources] == 1) & (np.bincount(targets, minlength=nodes_count)[targets] == 1)
+    roots = np.arange(nodes_count)
+    roots[targets[linear]] = sources[linear]
+    while True:
+        next_roots = roots[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+
+def coarsen(paths, offsets, node_columns, node_bases, width, min_weight):
+    lengths = np.diff(offsets)
+    columns_count = int(node_columns.max()) + 1
+    sequences_indices = np.repeat(np.arange(len(lengths)), lengths)
+    bins = node_columns[paths] // width
+
+    # EVERY SEQUENCE ENTERS A BIN OF width COLUMNS THROUGH ONE NODE, WHICH BECOMES ITS SUPER-NODE
+    entries = np.ones(len(paths), dtype=bool)
+    entries[1:] = (bins[1:] != bins[:-1]) | (sequences_indices[1:] != sequences_indices[:-1])
+    super_nodes, entries_super_nodes, weights = np.unique(paths[entries], return_inverse=True, return_counts=True)
+    super_bins = node_columns[super_nodes] // width
+
+    # LOW-WEIGHT BUBBLES ARE FOLDED INTO THE HEAVIEST SUPER-NODE OF THEIR BIN
+    order = np.lexsort((-weights, super_bins))
+    bins_starts = np.ones(len(order), dtype=bool)
+    bins_starts[1:] = super_bins[order][1:] != super_bins[order][:-1]
+    heaviest = np.zeros(columns_count // width + 1, dtype=np.int64)
+    heaviest[super_bins[order][bins_starts]] = order[bins_starts]
+    representatives = np.where(weights < min_weight, heaviest[super_bins], np.arange(len(super_nodes)))
+    level_paths = representatives[entries_super_nodes]
+    level_offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    np.cumsum(np.bincount(sequences_indices[entries], minlength=len(lengths)), out=level_offsets[1:])
+
+    # CHAINS OF SUPER-NODES ARE COLLAPSED
+    consecutive = np.ones(len(level_paths), dtype=bool)
+    consecutive[level_offsets[1:]-1] = False
+    edges = np.unique(level_paths[:-1][consecutive[:-1]].astype(np.int64) * len(super_nodes) + level_paths[1:][consecutive[:-1]])
+    roots = get_chains_roots(edges // len(super_nodes), edges % len(super_nodes), len(super_nodes))
+    chains, level_paths = np.unique(roots[level_paths], return_inverse=True)
+    level_sequences_indices = np.repeat(np.arange(len(lengths)), np.diff(level_offsets))
+    kept = np.ones(len(level_paths), dtype=bool)
+    kept[1:] = (level_paths[1:] != level_paths[:-1]) | (level_sequences_indices[1:] != level_sequences_indices[:-1])
+    level_paths = level_paths[kept].astype(np.int32)
+    np.cumsum(np.bincount(level_sequences_indices[kept], minlength=len(lengths)), out=level_offsets[1:])
+
+    chains_of_super_nodes = np.searchsorted(chains, roots[representatives])
+    used = np.unique(representatives)
+    first_columns = np.full(len(chains), columns_count, dtype=np.int64)
+    last_columns = np.zeros(len(chains), dtype=np.int64)
+    np.minimum.at(first_columns, chains_of_super_nodes[used], super_bins[used] * width)
+    np.maximum.at(last_columns, chains_of_super_nodes[used], np.minimum((super_bins[used]+1) * width, columns_count) - 1)
+    _, first_super_nodes = np.unique(chains_of_super_nodes[used], return_index=True)
+    _, last_super_nodes = np.unique(chains_of_super_nodes[used][::-1], return_index=True)
+    first_bases = node_bases[super_nodes[used][first_super_nodes]].tolist()
+    last_bases = node_bases[super_nodes[used][::-1][last_super_nodes]].tolist()
+    labels = [
+        first_base if first_column == last_column else f"{first_base}...{last_base}({last_column-first_column+1})"
+        for first_base, last_base, first_column, last_column in zip(first_bases, last_bases, first_columns.tolist(), last_columns.tolist())
+    ]
+    return Level(
+        width=width,
+        first_columns=first_columns,
+        last_columns=last_columns,
+        labels=labels,
+        paths=level_paths,
+        offsets=level_offsets,
+        diagram=get_edges(level_paths, level_offsets, len(chains)),
+    )
+
+
+def downsample(values, bins):
+    # EVERY BIN SPANS A RUN OF CONSECUTIVE COLUMNS, ONE BIN PER SCREEN PIXEL AT MOST
+    starts = np.unique(np.linspace(0, len(values), min(bins, len(values))+1).astype(np.int64)[:-1])
+    counts = np.diff(np.append(starts, len(values)))
+    return (
+        starts,
+        np.minimum.reduceat(values, starts),
+        np.maximum.reduceat(values, starts),
+        np.add.reduceat(values, starts) / counts,
+    )
 
 
 class GraphAlignment:
     def __init__(self, data):
-        self.column_dict = None
         self.consensus_sequence = None
-        self.nodes = None
+        self.consensus_positions = None
+        self.node_ids = None
+        self.node_bases = None
+        self.node_columns = None
+        self.node_blocks = None
+        self.column_nodes = None
+        self.column_offsets = None
+        self.node_ranks = None
+        self.paths = None
+        self.paths_offsets = None
+        self.snp_paths = None
+        self.snp_paths_offsets = None
         self.sequences = None
+        self.sequences_indices = None
+        self.affinity_sequences = None
         self.diagram = None
-        app.callback(
-            [Output("poagraph", "figure"),
-             Output("selected_vertex", "children")],
-            [Input("pangenome_hidden", 'children'),
-             Input("zoom-out-switch", "on"),
-             Input("poagraph-slider", "value"),
-             Input("poagraph_dropdown", "value"),
-             Input("consensus_tree_graph", 'clickData'),
-             Input("poagraph_checklist", 'value'),
-             Input("poagraph_threshold", 'value')],
-            [State("full_consensustable_hidden", 'children'),
-             State("full_consensustree_hidden", 'children')]
-        )(self.get_sankey_diagram)
-        app.callback(
-            [Output("poagraph-slider", "max"),
-             Output("poagraph-slider", "marks")],
-            [Input("pangenome_hidden", 'children')]
-        )(self.set_slider)
-        app.callback(
-            Output("poagraph-simplifications", "style"),
-            [Input("zoom-out-switch", "on")]
-        )(lambda x: {"visibility": "hidden"} if x else {})
-    
-    def update_data(self, data):
-        self.column_dict = self.c_dict(data["nodes"])
-        self.consensus_sequence = data["affinitytree"][0]["nodes_ids"]
-        self.nodes = self.get_nodes(data["nodes"])
-        self.sequences = {sequence["sequence_str_id"]: sequence["nodes_ids"][0] for sequence in data["sequences"]}
+        self.snp_diagram = None
+        self.levels = None
+        self.gaps = None
+        self.gaps_overview = None
+        self.data_nbytes = 0
+        self.dataset_key = None
+        self.chains = cache.LRUCache(max_bytes=CHAINS_MEMORY_LIMIT, on_resize=self._update_registered_nbytes)
+        self.tiles = cache.LRUCache(max_bytes=TILES_MEMORY_LIMIT, on_resize=self._update_registered_nbytes)
+        self.stages = cache.LRUCache(max_bytes=STAGES_MEMORY_LIMIT, on_resize=self._update_registered_nbytes)
+        if data:
+            self.update_data(data)
+
+    def update_data(self, data: Pangenome):
+        self.node_ids = data.node_ids
+        self.node_bases = data.node_bases
+        self.node_columns = data.node_columns
+        self.node_blocks = data.node_blocks
+        self.consensus_sequence = data.affinitytree[0]["nodes_ids"]
+        self.consensus_positions = np.full(len(self.node_ids), -1, dtype=np.int32)
+        self.consensus_positions[self.consensus_sequence] = np.arange(len(self.consensus_sequence), dtype=np.int32)
+        self.column_nodes, self.column_offsets = self.get_columns()
+        self.node_ranks = get_ranks(self.node_columns, self.column_nodes)
+        self.paths, self.paths_offsets = data.paths, data.paths_offsets
+        self.snp_paths, self.snp_paths_offsets = remove_snp(self.paths, self.paths_offsets, self.consensus_sequence, self.consensus_positions)
+        self.sequences = {
+            sequence_id: self.paths[start:end]
+            for sequence_id, start, end in zip(data.sequences_str_ids, self.paths_offsets[:-1], self.paths_offsets[1:])
+        }
+        self.sequences_indices = {sequence_id: i for i, sequence_id in enumerate(self.sequences)}
+        int_ids_indices = {int_id: i for i, int_id in enumerate(data.sequences_int_ids.tolist())}
+        self.affinity_sequences = {
+            node["affinity_node_id"]: np.array([int_ids_indices[int_id] for int_id in node["sequences_int_ids"].tolist()], dtype=np.int64)
+            for node in data.affinitytree
+        }
         self.diagram = self.construct_diagram()
-            
-    def get_nodes(self, nodes_data):
-        nodes_list = list()
-        for node in nodes_data:
-            column = self.column_dict[node["column_id"]]
-            for n in column:
-                if n in self.consensus_sequence:
-                    column.remove(n)
-                    column.insert(0, n)
-            
-            nodes_list.append(
-                Node(
-                    idx = node["id"], 
-                    base = node["base"],
-                    column = node["column_id"],
-                )
-            )
-        return nodes_list
-                
-    def c_dict(self, nodes_data):
-        column_dict = dict()
-        for node in nodes_data:
-            if node["column_id"] not in column_dict:
-                column_dict[node["column_id"]] = []
-            column_dict[node["column_id"]].append(node["id"])
-        return column_dict
-
-    def set_slider(self, hidden):
-        slider_max = len(self.column_dict)-1 if self.column_dict else 100
+        self.snp_diagram = self.construct_diagram(snp_removed=True)
+        self.levels = self.get_levels()
+        self.gaps = self.find_gaps()
+        self.gaps_overview = downsample(self.gaps, OVERVIEW_BINS)
+        self.data_nbytes = cache.get_nbytes({name: value for name, value in vars(self).items()
+                                             if not isinstance(value, cache.LRUCache)})
+
+    def get_columns(self):
+        # CONSENSUS NODE FIRST, THEN THE REST OF THE COLUMN BY NODE ID
+        column_nodes = np.lexsort((self.node_ids, self.consensus_positions < 0, self.node_columns)).astype(np.int32)
+        column_offsets = np.zeros(self.node_columns.max()+2, dtype=np.int64)
+        np.cumsum(np.bincount(self.node_columns), out=column_offsets[1:])
+        return column_nodes, column_offsets
+
+    def get_column(self, column_id):
+        return self.column_nodes[self.column_offsets[column_id]:self.column_offsets[column_id+1]]
+
+    @property
+    def columns_count(self):
+        return len(self.column_offsets)-1 if self.column_offsets is not None else 0
+
+    def set_slider(self):
+        slider_max = self.columns_count-1 if self.columns_count else 100
         slider_marks = {i: {"label": str(i)} for i in range(0, slider_max, 100)}
         return slider_max, slider_marks
     
     def find_gaps(self):
-        gaps = [0]*len(self.column_dict)
-        for sequence in self.sequences:
-            i=0
-            if len(self.sequences[sequence]) < len(gaps):
-                for node_id in self.sequences[sequence]:
-                    while self.nodes[node_id].column > i:
-                        gaps[i] += 1
-                        i += 1
-                    i += 1
-        return [gap/len(self.sequences) for gap in gaps]
-
-    def construct_diagram(self, sequences_values=None):
-        diagram_nodes = dict()
-        sequences_values = sequences_values if sequences_values else self.sequences.values()
-        for sequence in sequences_values:
-            for i, node_id in enumerate(sequence[:-2]):
-                source = self.nodes[node_id].id
-                target = self.nodes[sequence[i+1]].id
-
-                # SOURCE
-                if node_id in diagram_nodes:
-                    if target in diagram_nodes[node_id]["targets"]:
-                        diagram_nodes[node_id]["targets"][target] += 1
-                    else:
-                        diagram_nodes[node_id]["targets"][target] = 1
-                else:
-                    diagram_nodes[node_id] = dict(
-                        base = self.nodes[node_id].base,
-                        sources = {},
-                        targets = {target: 1},
-                    )
-                # TARGET
-                if target in diagram_nodes:
-                    if node_id in diagram_nodes[target]["sources"]:
-                        diagram_nodes[target]["sources"][node_id] += 1
-                    else:
-                        diagram_nodes[target]["sources"][node_id] = 1
-                else:
-                    diagram_nodes[target] = dict(
-                        base = self.nodes[target].base,
-                        sources = {node_id: 1},
-                        targets = {},
-                    )
-        return diagram_nodes
+        # A SEQUENCE HAS A GAP IN EVERY COLUMN IT DOES NOT PASS THROUGH
+        coverage = np.bincount(self.node_columns[self.paths], minlength=self.columns_count)
+        return np.maximum(len(self.sequences) - coverage, 0) / len(self.sequences)
+
+    def get_gaps_figure(self, slider_values):
+        starts, mins, maxs, means = self.gaps_overview
+        x = starts.tolist()
+        fig = go.Figure(
+            data=[
+                go.Scatter(x=x, y=maxs.tolist(), mode="lines", line=dict(width=0), hoverinfo="skip", showlegend=False),
+                go.Scatter(x=x, y=mins.tolist(), mode="lines", line=dict(width=0), fill="tonexty", fillcolor="lightgray", hoverinfo="skip", showlegend=False),
+                go.Scatter(x=x, y=means.tolist(), mode="lines", line=dict(color="gray", width=1), name="Mean gap frequency", showlegend=False),
+            ],
+            layout=dict(
+                height=150,
+                margin=dict(l=20, r=20, t=10, b=20),
+                xaxis=dict(range=[0, self.columns_count-1], fixedrange=True),
+                yaxis=dict(range=[0, 1], fixedrange=True),
+                shapes=[dict(
+                    type="rect",
+                    xref="x",
+                    yref="paper",
+                    x0=slider_values[0],
+                    x1=slider_values[1],
+                    y0=0,
+                    y1=1,
+                    line=dict(color="green"),
+                    fillcolor="green",
+                    opacity=0.2,
+                )]
+            )
+        )
+        return fig
+
+    def construct_diagram(self, snp_removed=False):
+        workers = server.config["DIAGRAM_WORKERS"]
+        if snp_removed:
+            return get_edges(self.snp_paths, self.snp_paths_offsets, len(self.node_ids), workers)
+        return get_edges(self.paths, self.paths_offsets, len(self.node_ids), workers)
+
+    def get_levels(self):
+        levels = []
+        width = LEVEL_WIDTH_FACTOR
+        while width < LEVEL_WIDTH_FACTOR * self.columns_count:
+            levels.append(coarsen(self.paths, self.paths_offsets, self.node_columns, self.node_bases, width, LEVEL_MIN_WEIGHT * len(self.sequences)))
+            if len(levels[-1].labels) <= SANKEY_NODES_LIMIT // LEVEL_WIDTH_FACTOR:
+                break
+            width *= LEVEL_WIDTH_FACTOR
+        return levels
+
+    def get_level(self, column_start, column_end):
+        # INPUTS OF A FEW COLUMNS HAVE NO LEVELS
+        if not self.levels:
+            return None
+        for level in self.levels:
+            if len(level.get_nodes(column_start, column_end)) <= SANKEY_NODES_LIMIT:
+                return level
+        return self.levels[-1]
+
+    def get_subset_mask(self, tree_node_id):
+        subset_mask = np.zeros(len(self.sequences), dtype=bool)
+        subset_mask[self.affinity_sequences[tree_node_id]] = True
+        return subset_mask
+
+    def get_subset_sequences(self, tree_node_id):
+        return [seq for seq, selected in zip(self.sequences, self.get_subset_mask(tree_node_id)) if selected]
+
+    def _get_window(self, outgoing, incoming, range_start, range_end):
+        diagram_window = {
+            node_id: dict(
+                base = base,
+                sources = {},
+                targets = {},
+            ) for node_id, base in enumerate(self.node_bases[range_start:range_end+1].tolist(), range_start)
+        }
+        for source, target, weight in zip(*(edges.tolist() for edges in outgoing)):
+            diagram_window[source]["targets"][target] = weight
+        for source, target, weight in zip(*(edges.tolist() for edges in incoming)):
+            diagram_window[target]["sources"][source] = weight
+        return diagram_window
     
+    def get_chains(self, snp_removed, tree_node_id, subset_bits=None):
+        # CHAINS DEPEND ONLY ON THE DIAGRAM AND THE SUBSET, NOT ON THE WINDOW
+        def create():
+            diagram = self.snp_diagram if snp_removed else self.diagram
+            sources, targets = diagram.sources, diagram.targets
+            if subset_bits is not None:
+                traversed = diagram.traversed_by(subset_bits)
+                sources, targets = sources[traversed], targets[traversed]
+            roots = get_chains_roots(sources, targets, len(self.node_ids))
+            # CHAIN r OWNS members[members_offsets[r]:members_offsets[r+1]], IN PATH ORDER
+            members = np.argsort(roots, kind="stable")
+            members_offsets = np.searchsorted(roots[members], np.arange(len(self.node_ids)+1))
+            return roots, members, members_offsets
+        return self.chains.get_or_create((snp_removed, tree_node_id), create)
+
+    def _get_chain_label(self, chain):
+        return "".join(self.node_bases[chain].tolist())
+
+    def _get_tile(self, tile, snp_removed, merge, tree_node_id, subset_bits):
+        def create():
+            diagram = self.snp_diagram if snp_removed else self.diagram
+            range_start = int(self.column_offsets[tile*TILE_COLUMNS])
+            range_end = int(self.column_offsets[min((tile+1)*TILE_COLUMNS, self.columns_count)])-1
+            labels = self.node_bases[range_start:range_end+1].tolist()
+            if not merge:
+                sources, targets, weights = diagram.outgoing(range_start, range_end, subset_bits)
+                return labels, sources, targets, weights
+            # A WHOLE CHAIN IS LABELLED AT ITS ROOT AND LINKED FROM ITS LAST NODE
+            roots, members, members_offsets = self.get_chains(snp_removed, tree_node_id, subset_bits)
+            heads = np.flatnonzero(roots[range_start:range_end+1] == np.arange(range_start, range_end+1)) + range_start
+            for head in heads[np.diff(members_offsets)[heads] > 1].tolist():
+                labels[head-range_start] = self._get_chain_label(members[members_offsets[head]:members_offsets[head+1]])
+            sources, targets, weights = diagram.outgoing_of(members[members_offsets[heads+1]-1], subset_bits)
+            return labels, roots[sources], targets, weights
+        return self.tiles.get_or_create((snp_removed, merge, tree_node_id, tile), create)
+
+    def _get_tiled_window(self, column_start, column_end, snp_removed, merge, tree_node_id, subset_bits):
+        range_start = int(self.column_offsets[column_start])
+        range_end = int(self.column_offsets[column_end+1])-1
+        first_tile = column_start // TILE_COLUMNS
+        tiles = [self._get_tile(tile, snp_removed, merge, tree_node_id, subset_bits) for tile in range(first_tile, column_end // TILE_COLUMNS + 1)]
+        tiles_start = int(self.column_offsets[first_tile*TILE_COLUMNS])
+        label = list(itertools.chain.from_iterable(labels for labels, _, _, _ in tiles))[range_start-tiles_start:range_end-tiles_start+1]
+        sources, targets, weights = (np.concatenate([tile[i] for tile in tiles]) for i in (1, 2, 3))
+        in_window = (sources >= range_start) & (sources <= range_end) & (targets <= range_end)
+        sources, targets, weights = sources[in_window], targets[in_window], weights[in_window]
+        if not merge:
+            return label, sources, targets, weights, np.zeros(len(label), dtype=bool)
+
+        # CHAINS CUT BY THE WINDOW ARE HEADED BY THEIR FIRST NODE INSIDE AND LINKED FROM THEIR LAST ONE
+        roots, members, members_offsets = self.get_chains(snp_removed, tree_node_id, subset_bits)
+        window_roots = roots[range_start:range_end+1]
+        merged = window_roots != np.arange(range_start, range_end+1)
+        chains_ends = members[members_offsets[window_roots+1]-1]
+        heads, ends = [], []
+        for root in np.unique(window_roots[(window_roots < range_start) | (chains_ends > range_end)]).tolist():
+            chain = members[members_offsets[root]:members_offsets[root+1]]
+            chain = chain[(chain >= range_start) & (chain <= range_end)]
+            label[chain[0]-range_start] = self._get_chain_label(chain)
+            merged[chain[0]-range_start] = False
+            heads.append(chain[0])
+            ends.append(chain[-1])
+        diagram = self.snp_diagram if snp_removed else self.diagram
+        ends_order = np.argsort(ends)
+        cut_sources, cut_targets, cut_weights = diagram.outgoing_of(np.array(ends, dtype=np.int64)[ends_order], subset_bits)
+        relinked = cut_targets <= range_end
+        cut_heads = np.array(heads, dtype=np.int64)[ends_order][np.searchsorted(np.array(ends, dtype=np.int64)[ends_order], cut_sources[relinked])]
+        return (
+            label,
+            np.concatenate([sources, cut_heads]),
+            np.concatenate([targets, cut_targets[relinked]]),
+            np.concatenate([weights, cut_weights[relinked]]),
+            merged,
+        )
+
+    def _memoize(self, stage, key, create):
+        # EVERY STAGE IS KEYED ONLY BY ITS OWN INPUTS
+        return self.stages.get_or_create((stage,) + key, create)
+
+    def _get_subset(self, tree_node_id):
+        def create():
+            if tree_node_id is None:
+                return np.ones(len(self.sequences), dtype=bool), None
+            subset_mask = self.get_subset_mask(tree_node_id)
+            return subset_mask, np.packbits(subset_mask)
+        return self._memoize("subset", (tree_node_id,), create)
+
+    def _get_window_edges(self, range_start, range_end, snp_removed, tree_node_id):
+        def create():
+            diagram = self.snp_diagram if snp_removed else self.diagram
+            _, subset_bits = self._get_subset(tree_node_id)
+            return diagram.outgoing(range_start, range_end, subset_bits), diagram.incoming(range_start, range_end, subset_bits)
+        return self._memoize("edges", (range_start, range_end, snp_removed, tree_node_id), create)
+
+    def _get_pruned_edges(self, range_start, range_end, snp_removed, tree_node_id, threshold):
+        def create():
+            outgoing, incoming = self._get_window_edges(range_start, range_end, snp_removed, tree_node_id)
+            out_kept, in_kept = prune_weak_connections(outgoing, incoming, range_start, range_end, threshold)
+            return tuple(edges[out_kept] for edges in outgoing), tuple(edges[in_kept] for edges in incoming)
+        return self._memoize("pruned", (range_start, range_end, snp_removed, tree_node_id, threshold), create)
+
+    def _get_simplified_window(self, column_start, column_end, snp_removed, threshold, merge, tree_node_id):
+        def create():
+            range_start = int(self.column_offsets[column_start])
+            range_end = int(self.column_offsets[column_end+1])-1
+            if threshold > 0:  # WEAK CONNECTIONS DEPEND ON THE WHOLE WINDOW
+                outgoing, incoming = self._get_pruned_edges(range_start, range_end, snp_removed, tree_node_id, threshold)
+                label, source, target, value, merged = self._get_pruned_window(outgoing, incoming, range_start, range_end, merge)
+            else:
+                _, subset_bits = self._get_subset(tree_node_id)
+                label, source, target, value, merged = self._get_tiled_window(column_start, column_end, snp_removed, merge, tree_node_id, subset_bits)
+            label = [l if len(l)<5 else f"{l[0]}...{l[-1]}({len(l)})" for l in label]
+            x, y = get_positions(self.node_columns[range_start:range_end+1], self.node_ranks[range_start:range_end+1])
+            return label, x, y, source, target, value, merged
+        return self._memoize("window", (column_start, column_end, snp_removed, threshold, merge, tree_node_id), create)
+
+    def _get_pruned_window(self, outgoing, incoming, range_start, range_end, merge):
+        diagram_filtered = self._get_window(outgoing, incoming, range_start, range_end)
+
+        if merge:  # CONCAT VERTICLES
+            diagram_filtered, diagram_reorganization = self._bound_vertices(diagram_filtered, range_start, range_end)
+        else:
+            diagram_reorganization = dict()
+
+        label, source, target, value = [], [], [], []
+        for node_id in range(range_start, range_end+1):
+            label.append(diagram_filtered[node_id]["base"])
+            for t, weight in diagram_filtered[node_id]["targets"].items():
+                if t <= range_end:
+                    source.append(node_id)
+                    target.append(t)
+                    value.append(weight)
+        merged = np.zeros(range_end-range_start+1, dtype=bool)
+        merged[np.array(list(diagram_reorganization), dtype=np.int64)-range_start] = True
+        return label, np.array(source, dtype=np.int64), np.array(target, dtype=np.int64), np.array(value, dtype=np.int64), merged
+
     def _bound_vertices(self, diagram, range_start, range_end):
         diagram_reorganization = dict()
-        for node_id in sorted(diagram.keys())[range_start:range_end+1]:
+        for node_id in range(range_start, range_end+1):
             node = diagram[node_id]
             if len(node["sources"]) == 1:
                 source_id = list(node["sources"].keys())[0]
@@ -152,151 +691,111 @@ class GraphAlignment:
                     diagram[node_id]["targets"] = {}
         return diagram, diagram_reorganization
 
-    def _remove_snp(self, consensus, sequence):
-        filtered_sequence = [sequence[0]]
-        for i, node_id in enumerate(sequence[1:-1]):
-            # SUBSTITUTION AND INSERTION
-            if node_id not in consensus and sequence[i] in consensus and sequence[i+2] in consensus:
-                before = consensus.index(sequence[i])
-                after = consensus.index(sequence[i+2])
-                if after-before == 1:  # INSERTION
-                    pass
-                elif after-before == 2:  # SUBSTITUTION
-                    filtered_sequence.append(consensus[before+1])
-                else:
-                    filtered_sequence.append(node_id)
-            # DELETION
-            elif node_id in consensus and sequence[i+2] in consensus:
-                before = consensus.index(sequence[i+1])
-                after = consensus.index(sequence[i+2])
-                if after-before == 2:  # DELETION
-                    filtered_sequence.append(node_id)
-                    filtered_sequence.append(consensus[before+1])
-                else:
-                    filtered_sequence.append(node_id)
-            else:
-                filtered_sequence.append(node_id)
-        filtered_sequence.append(sequence[-1])
-        return filtered_sequence
-            
+    def get_window_range(self, slider_values):
+        range_start = int(self.get_column(slider_values[0]).min())
+        range_end = int(self.get_column(slider_values[1]).max()) if slider_values[1] < self.columns_count else len(self.node_ids)-1
+        return range_start, range_end
 
-    def get_sankey_diagram(self, hidde, zoom_out, slider_values, highlight_seq, click_data, checklist, threshold, consensustable_data, consensustree_data):
+    def get_window_level(self, zoom_out, slider_values):
+        """Level of detail and its columns drawn instead of the window nodes, None if the window is drawn node by node.
+
+        Simplifications from the checklist apply only to windows drawn node by node.
+        """
+        if zoom_out:  # EXTREAME ZOOM-OUT
+            column_start, column_end = 0, self.columns_count-1
+        else:
+            range_start, range_end = self.get_window_range(slider_values)
+            if range_end-range_start+1 <= SANKEY_NODES_LIMIT:
+                return None
+            column_start, column_end = slider_values
+        level = self.get_level(column_start, column_end)
+        if level is None:
+            return None
+        return level, (column_start, column_end)
+
+    def get_sankey_diagram(self, zoom_out, slider_values, highlight_seq, click_data, checklist, threshold):
         if not self.sequences:
             raise PreventUpdate()
         
         # RANGE START / END
-        range_start = min(self.column_dict[slider_values[0]])
-        range_end = max(self.column_dict[slider_values[1]]) if slider_values[1] in self.column_dict else len(self.diagram)
-            
-        label = []
-        source = []
-        target = []
-        value = []
-        link_color = []
-        colors=dict(A="#FF9AA2", C="#B5EAD7", G="#C7CEEA", T="#FFDAC1")
-        
-        
+        range_start, range_end = self.get_window_range(slider_values)
+
         # FILTER SEQUENCES (AFFINITY TREE)
-        if click_data:
-            tree_node_id = click_data['points'][0]['pointIndex']
-            full_consensustable = pd.read_json(consensustable_data)
-            consensustree_data = json.loads(consensustree_data)
-            tree = consensustree.dict_to_tree(consensustree_data)
-            node_details_df = consensustable.get_consensus_details_df(tree_node_id, full_consensustable, tree)
-            filtered_sequences = node_details_df["SEQID"].tolist()
-            diagram_filtered = self.construct_diagram(sequences_values=[self.sequences[seq] for seq in filtered_sequences])
-            
-            for i in range(len(self.column_dict)):
-                if i not in diagram_filtered:
-                    diagram_filtered[i] = dict(
-                        base = "",
-                        sources = {},
-                        targets = {},
-                    )
-        else:
-            tree_node_id = None
-            filtered_sequences = list(self.sequences.keys())
-            diagram_filtered = copy.deepcopy(self.diagram)
-        
-        if zoom_out:  # EXTREAME ZOOM-OUT
-            checklist = [1, 2]
-            threshold = len(self.sequences)*0.2
-            range_start = 0
-            range_end = len(self.column_dict)-1
-
-        if 3 in checklist:
-            sequences_values = [self.sequences[seq] for seq in filtered_sequences]
-            new_sequences_values = [self._remove_snp(self.consensus_sequence, sequence) for sequence in sequences_values]
-            diagram_filtered = self.construct_diagram(sequences_values=new_sequences_values)
-            for i in range(len(self.diagram)):
-                if i not in diagram_filtered:
-                    diagram_filtered[i] = dict(
-                        base = "",
-                        sources = {},
-                        targets = {},
-                    )
-
-        if 2 in checklist and threshold > 0:  # WEAK CONNECTIONS                
-            weak_nodes = list()
-            for node_id in sorted(diagram_filtered.keys())[range_start:range_end+1]:
-                node = diagram_filtered[node_id]
-                if node["sources"] and (all([x in weak_nodes for x in node["sources"].keys()]) or all([x<=threshold for x in node["sources"].values()])):
-                    weak_nodes.append(node_id)
-                    diagram_filtered[node_id]["sources"] = {}
-                    diagram_filtered[node_id]["targets"] = {}
-                else:
-                    diagram_filtered[node_id]["sources"] = {key: value for key, value in node["sources"].items() if value>threshold}
-                    diagram_filtered[node_id]["targets"] = {key: value for key, value in node["targets"].items() if value>threshold}
-            
-            for node_id in sorted(diagram_filtered.keys())[range_end-1:range_start:-1]:
-                node = diagram_filtered[node_id]
-                if node["targets"] and all([x in weak_nodes for x in node["targets"].keys()]):
-                    weak_nodes.append(node_id)
-                    diagram_filtered[node_id]["sources"] = {}
-                    diagram_filtered[node_id]["targets"] = {}
-                else:
-                    diagram_filtered[node_id]["sources"] = {key: value for key, value in node["sources"].items() if key not in weak_nodes}
-                    diagram_filtered[node_id]["targets"] = {key: value for key, value in node["targets"].items() if key not in weak_nodes}
-
-
-        if 1 in checklist:  # CONCAT VERTICLES
-            diagram_filtered, diagram_reorganization = self._bound_vertices(diagram_filtered, range_start, range_end)
-        else:
-            diagram_reorganization = dict()
+        tree_node_id = click_data['points'][0]['pointIndex'] if click_data else None
+        subset_mask, _ = self._get_subset(tree_node_id)
 
-        if highlight_seq and highlight_seq in filtered_sequences:  # HIGHLIGHT SEQUENCE
-            highlight_seq_nodes = [node_id for node_id in self.sequences[highlight_seq] if node_id not in diagram_reorganization.keys()]
-        else:
-            highlight_seq_nodes = []
-        
-        for node_id in sorted(diagram_filtered.keys())[range_start:range_end+1]:
-            label.append(diagram_filtered[node_id]["base"])
-            for t in diagram_filtered[node_id]["targets"]:
-                if t <= range_end:
-                    source.append(node_id-range_start)
-                    target.append(t-range_start)
-                    value.append(diagram_filtered[node_id]["targets"][t])
-                    link_color.append("#D3D3D3")
-                    
-                    # HIGHLIGHT SEQUENCE
-                    if highlight_seq_nodes and node_id in highlight_seq_nodes:
-                        s_id = highlight_seq_nodes.index(node_id)
-                        if highlight_seq_nodes[s_id+1] == t:
-                            value[-1] -= 1
-                            source.append(node_id-range_start)
-                            target.append(t-range_start)
-                            value.append(1)
-                            link_color.append("#342424")
+        # EVERY SELECTED SEQUENCE KEEPS ITS COLOUR EVEN IF OTHERS ARE OUTSIDE THE SUBSET
+        highlight_seqs = [highlight_seq] if isinstance(highlight_seq, str) else highlight_seq or []
+        highlighted = [
+            (self.sequences_indices[seq_id], color) for seq_id, color in zip(highlight_seqs, itertools.cycle(HIGHLIGHT_COLORS))
+            if seq_id in self.sequences_indices and subset_mask[self.sequences_indices[seq_id]]
+        ]
 
-        
-        colors = dict(A="#FF9AA2", C="#B5EAD7", G="#C7CEEA", T="#FFDAC1")
+        # LEVEL OF DETAIL
+        window_level = self.get_window_level(zoom_out, slider_values)
+        if window_level is not None:
+            level, level_columns = window_level
+            return self._get_figure(*self._get_level_links(level, *level_columns, tree_node_id, highlighted)), str(tree_node_id)
+
+        # REMOVAL OF SNP, WEAK CONNECTIONS AND CONCAT VERTICLES
+        label, x, y, source, target, value, merged = self._get_simplified_window(
+            slider_values[0],
+            min(slider_values[1], self.columns_count-1),
+            3 in checklist,
+            threshold if 2 in checklist and threshold > 0 else 0,
+            1 in checklist,
+            tree_node_id,
+        )
+
+        # HIGHLIGHT SEQUENCE (MERGED VERTICES ARE SKIPPED ON ITS PATH)
+        merged = np.append(merged, False)
+        paths = []
+        for seq_index, color in highlighted:
+            path = get_path_window(self.paths[self.paths_offsets[seq_index]:self.paths_offsets[seq_index+1]], range_start, range_end)
+            paths.append((path[~merged[np.minimum(path-range_start, len(merged)-1)]], color))
+        source, target, value, link_color = highlight_links(source, target, value, paths, len(self.node_ids))
+
+        return self._get_figure(label, (source-range_start).tolist(), (target-range_start).tolist(), value.tolist(), link_color.tolist(), x, y), str(tree_node_id)
+
+    def _get_level_links(self, level, column_start, column_end, tree_node_id, highlighted):
+        nodes = level.get_nodes(column_start, column_end)
+        # LEVEL NODES OUTSIDE THE WINDOW MAP TO len(nodes), WHICH NO LINK STARTS OR ENDS AT
+        window_indices = np.full(len(level.labels), len(nodes), dtype=np.int64)
+        window_indices[nodes] = np.arange(len(nodes))
+
+        def create():
+            _, subset_bits = self._get_subset(tree_node_id)
+            sources, targets, weights = level.diagram.outgoing_of(nodes, subset_bits)
+            sources, targets = window_indices[sources], window_indices[targets]
+            in_window = targets < len(nodes)
+            return sources[in_window], targets[in_window], weights[in_window]
+        sources, targets, weights = self._memoize("level", (level.width, column_start, column_end, tree_node_id), create)
+
+        # HIGHLIGHT SEQUENCE
+        paths = [
+            (window_indices[level.paths[level.offsets[seq_index]:level.offsets[seq_index+1]]], color)
+            for seq_index, color in highlighted
+        ]
+        sources, targets, weights, link_color = highlight_links(sources, targets, weights, paths, len(nodes)+1)
+        return (
+            [level.labels[node] for node in nodes.tolist()],
+            sources.tolist(),
+            targets.tolist(),
+            weights.tolist(),
+            link_color.tolist(),
+            *get_positions(level.first_columns[nodes], level.ranks[nodes]),
+        )
+
+    def _get_figure(self, label, source, target, value, link_color, x, y):
         fig = go.Figure(
             data=go.Sankey(
-                arrangement = "snap",
+                arrangement = "fixed",
                 node = dict(
-                    label=[l if len(l)<5 else f"{l[0]}...{l[-1]}({len(l)})" for l in label],
+                    label=label,
+                    x=x,
+                    y=y,
                     pad=10,
-                    color=[colors[l] if l in colors else "gray" for l in label]
+                    color=[BASE_COLORS[l] if l in BASE_COLORS else "gray" for l in label]
                 ),
                 link = dict(
                     source=source,
@@ -310,7 +809,44 @@ class GraphAlignment:
                 # width=1600
             )
         )
-        
-        return fig, str(tree_node_id) 
+        return fig
+
+    @property
+    def nbytes(self):
+        return self.data_nbytes + self.chains.nbytes + self.tiles.nbytes + self.stages.nbytes
+
+    def _update_registered_nbytes(self):
+        # THE REGISTRY BUDGET COVERS THE CACHES GROWING AFTER REGISTRATION
+        if self.dataset_key is not None:
+            alignments.resize(self.dataset_key, self, self.nbytes)
+
+
+alignments = cache.LRUCache(max_bytes=server.config["ALIGNMENTS_MEMORY_LIMIT"])
+# ALIGNMENTS BUILT PER DATASET KEY, EXPECTED TO STAY AT 1 UNTIL EVICTED
+builds = Counter()
+building_locks = defaultdict(threading.Lock)
+building_locks_lock = threading.Lock()
+
+
+def get_alignment(dataset_key) -> GraphAlignment:
+    alignment = alignments.get(dataset_key)
+    if alignment is not None:
+        return alignment
+    with building_locks_lock:
+        building_lock = building_locks[dataset_key]
+    # CALLBACKS READING ONE DATASET WAIT FOR THE FIRST BUILD INSTEAD OF BUILDING AGAIN
+    with building_lock:
+        alignment = alignments.get(dataset_key)
+        if alignment is None:
+            # EVICTED OR BUILT BY ANOTHER WORKER
+            alignment = GraphAlignment(pangenome.get_dataset(dataset_key))
+            builds[dataset_key] += 1
+            register_alignment(dataset_key, alignment)
+    with building_locks_lock:
+        building_locks.pop(dataset_key, None)
+    return alignment
+
 
-alignment_main_object = GraphAlignment(data={})
+def register_alignment(dataset_key, alignment: GraphAlignment) -> None:
+    alignment.dataset_key = dataset_key
+    alignments.set(dataset_key, alignment, alignment.nbytes)
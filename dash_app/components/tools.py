@@ -2,7 +2,6 @@ import os
 import shutil
 import uuid
 import base64
-import json
 from datetime import datetime
 from io import StringIO
 from pathlib import Path
@@ -11,10 +10,6 @@ from typing import Optional
 from pangtreebuild.serialization.json import PangenomeJSON, str_to_PangenomeJSON
 
 
-def read_upload(content: str) -> dict:
-    content_string = base64.b64decode(content.split(',')[1]).decode('ascii')
-    return json.loads(content_string)
-
 def unjsonify_jsonpangenome(jsonified_pangenome: str) -> PangenomeJSON:
     return str_to_PangenomeJSON(jsonified_pangenome)
 
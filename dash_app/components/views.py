@@ -0,0 +1,90 @@
+"""Server-side objects behind the PangTreeVis hidden divs, which carry only their keys.
+
+A view key is the JSON list [view name, dataset key, *parameters], so any
+worker can rebuild an evicted view from the dataset store.
+"""
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from dash_app.components import cache, consensustable, consensustree, pangenome
+from dash_app.server import server
+
+
+views = cache.LRUCache(max_bytes=server.config["VIEWS_MEMORY_LIMIT"])
+builders: Dict[str, Callable[..., Any]] = dict()
+
+
+def view(name: str) -> Callable:
+    def decorator(build):
+        builders[name] = build
+        return build
+    return decorator
+
+
+def get_key(name: str, dataset_key: str, *parameters) -> str:
+    return json.dumps([name, dataset_key, *parameters])
+
+
+def get_dataset_key(view_key: str) -> str:
+    return json.loads(view_key)[1]
+
+
+def get(view_key: str) -> Any:
+    value = views.get(view_key)
+    if value is None:
+        name, dataset_key, *parameters = json.loads(view_key)
+        value = builders[name](dataset_key, *parameters)
+        views.set(view_key, value, get_nbytes(value))
+    return value
+
+
+def get_nbytes(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return cache.get_nbytes(value)
+
+
+@view("full_consensustable")
+def get_full_consensustable(dataset_key: str) -> pd.DataFrame:
+    return consensustable.get_full_table_data(pangenome.get_dataset(dataset_key))
+
+
+@view("consensustree")
+def get_consensustree(dataset_key: str) -> nx.DiGraph:
+    tree = consensustree.get_consensustree(pangenome.get_dataset(dataset_key))
+    # NODES IN THE DEPTH-FIRST ORDER THE TREE HAD WHEN IT WAS SENT AS A DICT, LEAVES ARE PLACED BY IT
+    return consensustree.dict_to_tree(consensustree.tree_to_dict(tree))
+
+
+@view("consensuses_visibility")
+def get_consensuses_visibility(dataset_key: str) -> consensustable.ConsensusesVisibility:
+    return consensustable.ConsensusesVisibility(get(get_key("consensustree", dataset_key)))
+
+
+@view("partial_consensustable")
+def get_partial_consensustable(dataset_key: str, slider_value: float) -> List[str]:
+    """Columns of the full table shown at slider_value, the table itself is not copied."""
+    full_consensustable = get(get_key("full_consensustable", dataset_key))
+    visible_columns = set(consensustable.get_metadata_list(full_consensustable))
+    visible_columns.update(get(get_key("consensuses_visibility", dataset_key)).get_columns(slider_value))
+    return [column for column in full_consensustable.columns if column in visible_columns]
+
+
+@view("column_order")
+def get_column_order(dataset_key: str, column: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Dense ranks of a full table column and the stable argsort of its rows."""
+    ranks = consensustable.get_column_ranks(get(get_key("full_consensustable", dataset_key))[column])
+    return ranks, np.argsort(ranks, kind="stable")
+
+
+@view("rows_order")
+def get_rows_order(dataset_key: str, sort_by: List[List[str]]) -> np.ndarray:
+    """Rows of the full table sorted by [column, "asc" or "desc"] pairs, the first pair sorts first."""
+    columns_orders = [get(get_key("column_order", dataset_key, column)) for column, _ in sort_by]
+    return consensustable.get_rows_order([ranks for ranks, _ in columns_orders],
+                                         [order for _, order in columns_orders],
+                                         [direction == "desc" for _, direction in sort_by])
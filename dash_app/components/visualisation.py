@@ -1,9 +1,6 @@
 import dash_html_components as html
-from dash.exceptions import PreventUpdate
-from pangtreebuild.serialization.json import TaskParameters, PangenomeJSON
-from dash_app.components import tools
-import os
-from pathlib import Path
+from pangtreebuild.serialization.json import TaskParameters
+import hashlib
 
 
 def get_task_params(task_parameters: TaskParameters):
@@ -12,24 +9,16 @@ def get_task_params(task_parameters: TaskParameters):
             html.P(f"Input: {task_parameters.multialignment_file_path}")]
 
 
-def read_pangenome_upload(upload_content) -> PangenomeJSON:
-    if not upload_content:
-        raise PreventUpdate()
-    if upload_content.startswith("data:application/json;base64"):
-        jsonified_pangenome = tools.decode_content(upload_content)
-    else:
-        jsonified_pangenome = upload_content
-    return tools.unjsonify_jsonpangenome(jsonified_pangenome)
+HASH_CHUNK_SIZE = 1024**2
 
 
-def get_hash(pangenome_upload_contents) -> int:
-    return hash(pangenome_upload_contents)
-
-
-def get_elem_cache_info(pangenome_hash: int) -> Path:
-    cache_file_name = str(abs(pangenome_hash)) + ".pickle"
-    parent_output_dir = Path(os.path.abspath(os.path.join(os.path.dirname(__file__)))).joinpath("../cache/").resolve()
-    poagraph_elements_cache_path = tools.get_child_path(parent_output_dir, cache_file_name)
-    return poagraph_elements_cache_path
+def get_hash(pangenome_upload_contents: str) -> str:
+    # SALTED hash() DIFFERS BETWEEN WORKERS AND RESTARTS
+    digest = hashlib.sha256()
+    # ONLY THE BASE64 PAYLOAD, ENCODED CHUNK BY CHUNK INSTEAD OF COPYING THE WHOLE UPLOAD
+    start = pangenome_upload_contents.find(",") + 1 if pangenome_upload_contents.startswith("data:") else 0
+    for chunk_start in range(start, len(pangenome_upload_contents), HASH_CHUNK_SIZE):
+        digest.update(pangenome_upload_contents[chunk_start:chunk_start+HASH_CHUNK_SIZE].encode("utf-8"))
+    return digest.hexdigest()
 
 
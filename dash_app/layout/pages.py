@@ -1,9 +1,12 @@
+import uuid
+from typing import Optional
+
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_daq as daq
 import dash_html_components as html
 import dash_table
-from pangtreebuild.serialization.json import PangenomeJSON
+from pangtreebuild.serialization.json import TaskParameters
 
 from dash_app.layout import links
 
@@ -166,7 +169,8 @@ def pangtreebuild():
 
 
 def pangtreevis():
-    return _pangviz_tab_content
+    # A NEW ID FOR EVERY RENDERED PAGE, REQUEST COALESCING IS PER TAB
+    return html.Div([dcc.Store(id="page_id", data=uuid.uuid4().hex), _pangviz_tab_content])
 
 
 """-------------------------- PANGTREEBUILD ---------------------------------"""
@@ -524,13 +528,16 @@ _poagraph_row = dbc.Row(
                 html.Div(
                     id="poagraph_container",
                     children=dcc.Loading(
-                        dcc.Graph(
-                            id="poagraph",
-                            figure={},
-                            config={
-                                'displayModeBar': False,
-                            }
-                        ),
+                        [
+                            dcc.Store(id="poagraph_data"),
+                            dcc.Graph(
+                                id="poagraph",
+                                figure={},
+                                config={
+                                    'displayModeBar': False,
+                                }
+                            ),
+                        ],
                         type="circle"
                     )
                 )
@@ -600,14 +607,14 @@ _poagraph_row = dbc.Row(
                                 html.Span("0", id="selected_vertex"),
                                 html.I(className="fas fa-question-circle fa-lg tooltip-icon", id="tree-tooltip"),
                                 dbc.Tooltip("By clicking on a vertex in the Affinity Tree, limit the sequences used in the graph to its subtree. Click node \"0\" to reset.", target="tree-tooltip"),
-                                html.P("Highlight the sequence:"),
+                                html.P("Highlight the sequences:"),
                                 dcc.Dropdown(
                                     id="poagraph_dropdown",
                                     options=[
                                         {'label': f'seq{i}', 'value': f'seq{i}'} for i in range(1, 5)
                                     ],
-                                    value='',
-                                    multi=False,
+                                    value=[],
+                                    multi=True,
                                 )
                             ],
                             style={"text-align": "left"}
@@ -615,18 +622,33 @@ _poagraph_row = dbc.Row(
                     ]
                 ) 
             ]),
-            # _pangenome_row,
+            _pangenome_row,
         ])
     ], className="vis_row")
 
 _consensus_table = html.Div([
     html.H4("Consensuses on current cut level"),
+    html.Div([
+        html.P("Consensus columns shown from:"),
+        dcc.Slider(
+            id="consensuses_table_columns_offset",
+            min=0,
+            max=0,
+            step=1,
+            value=0
+        )
+    ]),
     html.Div(
         dcc.Loading(
+            # ROWS ARE PAGED AND SORTED ON THE SERVER, ONLY THE CURRENT PAGE IS SENT
             dash_table.DataTable(
                 id="consensuses_table",
-                sort_action="native",
+                page_action="custom",
+                page_current=0,
+                page_size=50,
+                sort_action="custom",
                 sort_mode="multi",
+                sort_by=[],
                 data=[{"ID": 0}, {"ID": 1}],
                 columns=[{"name": i, "id": i} for i in ["ID"]]
             ),
@@ -652,14 +674,17 @@ _affinity_tree_row = html.Div([
             )], 
             style={'width': '20%'}),
         dcc.Loading(
-            dcc.Graph(
-                id="consensus_tree_graph",
-                style={'height': '600px', 'width': 'auto'},
-                config={
-                    'displayModeBar': False,
-                    'scrollZoom': False,
-                },
-            ),
+            [
+                dcc.Store(id="consensus_tree_data"),
+                dcc.Graph(
+                    id="consensus_tree_graph",
+                    style={'height': '600px', 'width': 'auto'},
+                    config={
+                        'displayModeBar': False,
+                        'scrollZoom': False,
+                    },
+                ),
+            ],
             type="circle"
         ),
         dcc.Slider(
@@ -694,11 +719,9 @@ _affinity_tree_row = html.Div([
 loading_style = "circle"
 _pangviz_tab_content = dbc.Container([
     dcc.Store(id="visualisation_session_info", data=""),
-    dcc.Store(id="elements_cache_info", data=""),
     dbc.Row(
         style={'display': 'none'},
         children=[
-            html.Div(id="pangenome_hidden"),
             html.Div(id="poagraph_hidden"),
             html.Div(id="full_consensustree_hidden"),
             html.Div(id="partial_consensustable_hidden"),
@@ -718,34 +741,35 @@ _pangviz_tab_content = dbc.Container([
 ], fluid=True)
 
 
-def get_task_description_layout(jsonpangenome: PangenomeJSON) -> dbc.CardDeck():
+def get_task_description_layout(task_parameters: TaskParameters, nodes_count: Optional[int], sequences_count: int,
+                                consensuses_count: int) -> dbc.CardDeck():
     fasta_provider_paragraph = html.P()
-    if jsonpangenome.task_parameters.multialignment_format == "Maf":
-        opt = jsonpangenome.task_parameters.fasta_complementation_option
+    if task_parameters.multialignment_format == "Maf":
+        opt = task_parameters.fasta_complementation_option
         if opt == "ConstSymbolProvider":
-            o = f"Const symbol {jsonpangenome.task_parameters.missing_base_symbol}"
+            o = f"Const symbol {task_parameters.missing_base_symbol}"
         elif opt == "FromFile":
-            o = f"Fasta file {jsonpangenome.task_parameters.fasta_source_file}"
+            o = f"Fasta file {task_parameters.fasta_source_file}"
         else:
             o = "NCBI"
         fasta_provider_paragraph = html.P(f"Fasta provider: {o}")
 
-    if jsonpangenome.task_parameters.consensus_type == "poa":
+    if task_parameters.consensus_type == "poa":
         cons_type_paragraph = [
-            html.P(f"Hbmin: {jsonpangenome.task_parameters.hbmin}")]
+            html.P(f"Hbmin: {task_parameters.hbmin}")]
     else:
-        cons_type_paragraph = [html.P(f"P: {jsonpangenome.task_parameters.p}"),
+        cons_type_paragraph = [html.P(f"P: {task_parameters.p}"),
                                html.P(
-                                   f"Stop: {jsonpangenome.task_parameters.stop}")]
+                                   f"Stop: {task_parameters.stop}")]
 
     return dbc.CardDeck([
         dbc.Card([
             dbc.CardBody([
                 html.P([
                     html.P(
-                        f"Multialignment: {jsonpangenome.task_parameters.multialignment_file_path}"),
+                        f"Multialignment: {task_parameters.multialignment_file_path}"),
                     html.P(
-                        f"Metadata : {jsonpangenome.task_parameters.metadata_file_path}"),
+                        f"Metadata : {task_parameters.metadata_file_path}"),
                     fasta_provider_paragraph
                 ], className='card-text'),
             ]),
@@ -755,9 +779,9 @@ def get_task_description_layout(jsonpangenome: PangenomeJSON) -> dbc.CardDeck():
             dbc.CardBody([
                 html.P([
                            html.P(
-                               f"Algorithm: {jsonpangenome.task_parameters.consensus_type}"),
+                               f"Algorithm: {task_parameters.consensus_type}"),
                            html.P(
-                               f"Blosum file: {jsonpangenome.task_parameters.blosum_file_path}")
+                               f"Blosum file: {task_parameters.blosum_file_path}")
                        ] + cons_type_paragraph, className='card-text'),
             ]),
             dbc.CardFooter("Consensus Configuration", className="text-center")
@@ -766,12 +790,12 @@ def get_task_description_layout(jsonpangenome: PangenomeJSON) -> dbc.CardDeck():
             dbc.CardBody([
                 html.P([
                     html.P(
-                        f"Time: {jsonpangenome.task_parameters.running_time}"),
+                        f"Time: {task_parameters.running_time}"),
                     html.P(["Poagraph nodes count: ",
-                            f"{len(jsonpangenome.nodes)}" if jsonpangenome.nodes else "unknown"]),
-                    html.P(f"Sequences count: {len(jsonpangenome.sequences)}"),
+                            f"{nodes_count}" if nodes_count else "unknown"]),
+                    html.P(f"Sequences count: {sequences_count}"),
                     html.P(
-                        f"Consensuses count: {len(jsonpangenome.affinitytree)}"),
+                        f"Consensuses count: {consensuses_count}"),
                 ], className='card-text'),
             ]),
             dbc.CardFooter("Processing info", className="text-center")
@@ -1,9 +1,23 @@
+import os
+
 from flask import Flask, session
 from flask_session import Session
 from dash import Dash
 
 server = Flask('PangTree')
 server.config.from_object(__name__)
+server.config["ALIGNMENTS_MEMORY_LIMIT"] = int(os.environ.get("PANGTREE_ALIGNMENTS_MEMORY_LIMIT", 2 * 1024**3))
+server.config["PANGENOMES_MEMORY_LIMIT"] = int(os.environ.get("PANGTREE_PANGENOMES_MEMORY_LIMIT", 1024**3))
+server.config["VIEWS_MEMORY_LIMIT"] = int(os.environ.get("PANGTREE_VIEWS_MEMORY_LIMIT", 512 * 1024**2))
+# SECONDS A REQUEST WAITS FOR A NEWER ONE WHEN ANOTHER IS IN FLIGHT FOR THE SAME PAGE AND OUTPUT, 0 NEVER WAITS
+server.config["COALESCING_DELAY"] = float(os.environ.get("PANGTREE_COALESCING_DELAY", 0.05))
+# SEQUENCE SHARDS COUNTED IN PARALLEL WHEN BUILDING DIAGRAMS, 1 BUILDS IN-PROCESS, MORE NEED PYTHON 3.8
+server.config["DIAGRAM_WORKERS"] = int(os.environ.get("PANGTREE_DIAGRAM_WORKERS", 1))
+# PARSED UPLOADS KEPT ON DISK BY SHA-256, SHARED BY WORKERS AND RESTARTS, OUTSIDE THE SOURCE TREE
+server.config["DATASETS_CACHE_DIR"] = os.environ.get(
+    "PANGTREE_DATASETS_CACHE_DIR",
+    os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "pangtreevis"))
+server.config["DATASETS_CACHE_LIMIT"] = int(os.environ.get("PANGTREE_DATASETS_CACHE_LIMIT", 4 * 1024**3))
 server.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
  
 app = Dash(
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# PARSED DATASETS OF THE TESTS DO NOT GO TO THE USER'S CACHE
+os.environ.setdefault("PANGTREE_DATASETS_CACHE_DIR", tempfile.mkdtemp(prefix="pangtreevis-tests-"))
@@ -0,0 +1,155 @@
+"""Reference Sankey diagram of a poagraph window, built the way PangTreeVis built it before vectorization.
+
+Nodes are kept in dicts of sources and targets, so the result is slow but easy to follow.
+The extreme zoom-out, now drawn from levels of detail, is not covered.
+"""
+from typing import Dict, List, Optional, Tuple
+
+LINK_COLOR = "#D3D3D3"
+HIGHLIGHT_COLOR = "#342424"
+BASE_COLORS = dict(A="#FF9AA2", C="#B5EAD7", G="#C7CEEA", T="#FFDAC1")
+
+
+def get_empty_node(base: str) -> Dict:
+    return dict(base=base, sources={}, targets={})
+
+
+def construct_diagram(bases: List[str], sequences: List[List[int]]) -> Dict[int, Dict]:
+    diagram = {node_id: get_empty_node(base) for node_id, base in enumerate(bases)}
+    for sequence in sequences:
+        # THE LAST EDGE OF EVERY SEQUENCE WAS NEVER COUNTED
+        for source, target in zip(sequence[:-2], sequence[1:-1]):
+            diagram[source]["targets"][target] = diagram[source]["targets"].get(target, 0) + 1
+            diagram[target]["sources"][source] = diagram[target]["sources"].get(source, 0) + 1
+    return diagram
+
+
+def remove_snp(consensus: List[int], sequence: List[int]) -> List[int]:
+    # consensus.index OF EVERY CONSENSUS NODE
+    positions = {node_id: i for i, node_id in reversed(list(enumerate(consensus)))}
+    filtered_sequence = [sequence[0]]
+    for i, node_id in enumerate(sequence[1:-1]):
+        # SUBSTITUTION AND INSERTION
+        if node_id not in positions and sequence[i] in positions and sequence[i+2] in positions:
+            before = positions[sequence[i]]
+            after = positions[sequence[i+2]]
+            if after-before == 1:  # INSERTION
+                pass
+            elif after-before == 2:  # SUBSTITUTION
+                filtered_sequence.append(consensus[before+1])
+            else:
+                filtered_sequence.append(node_id)
+        # DELETION
+        elif node_id in positions and sequence[i+2] in positions:
+            before = positions[sequence[i+1]]
+            after = positions[sequence[i+2]]
+            if after-before == 2:  # DELETION
+                filtered_sequence.append(node_id)
+                filtered_sequence.append(consensus[before+1])
+            else:
+                filtered_sequence.append(node_id)
+        else:
+            filtered_sequence.append(node_id)
+    filtered_sequence.append(sequence[-1])
+    return filtered_sequence
+
+
+def prune_weak_connections(diagram: Dict[int, Dict], range_start: int, range_end: int, threshold: float) -> Dict[int, Dict]:
+    weak_nodes = list()
+    for node_id in range(range_start, range_end+1):
+        node = diagram[node_id]
+        if node["sources"] and (all(x in weak_nodes for x in node["sources"]) or all(x <= threshold for x in node["sources"].values())):
+            weak_nodes.append(node_id)
+            node["sources"], node["targets"] = {}, {}
+        else:
+            node["sources"] = {key: value for key, value in node["sources"].items() if value > threshold}
+            node["targets"] = {key: value for key, value in node["targets"].items() if value > threshold}
+
+    for node_id in range(range_end-1, range_start, -1):
+        node = diagram[node_id]
+        if node["targets"] and all(x in weak_nodes for x in node["targets"]):
+            weak_nodes.append(node_id)
+            node["sources"], node["targets"] = {}, {}
+        else:
+            node["sources"] = {key: value for key, value in node["sources"].items() if key not in weak_nodes}
+            node["targets"] = {key: value for key, value in node["targets"].items() if key not in weak_nodes}
+    return diagram
+
+
+def bound_vertices(diagram: Dict[int, Dict], range_start: int, range_end: int) -> Tuple[Dict[int, Dict], Dict[int, int]]:
+    diagram_reorganization = dict()
+    for node_id in range(range_start, range_end+1):
+        node = diagram[node_id]
+        if len(node["sources"]) == 1:
+            source_id = list(node["sources"].keys())[0]
+            source_value = node["sources"][source_id]
+            while source_id in diagram_reorganization:
+                source_id = diagram_reorganization[source_id]
+            node["sources"] = {source_id: source_value}
+            if source_id >= range_start and len(diagram[source_id]["targets"]) == 1:
+                diagram_reorganization[node_id] = source_id
+                diagram[source_id]["base"] += node["base"]
+                diagram[source_id]["targets"] = node["targets"]
+                node["sources"], node["targets"] = {}, {}
+    return diagram, diagram_reorganization
+
+
+def get_sankey(pangenome: Dict, slider_values: List[int], highlight_seq: Optional[str], tree_node_id: Optional[int],
+               checklist: List[int], threshold: float) -> Tuple[List[str], List[str], List[Tuple[int, int, int, str]]]:
+    """Labels, node colors and links (source, target, value, color) of the window, links are sorted.
+
+    pangenome is the parsed PangTreeVis JSON, checklist holds 1 (merge chains), 2 (weak connections)
+    and 3 (SNP removal) as in the poagraph_checklist.
+    """
+    bases = [node["base"] for node in sorted(pangenome["nodes"], key=lambda node: node["id"])]
+    columns = dict()
+    for node in pangenome["nodes"]:
+        columns.setdefault(node["column_id"], []).append(node["id"])
+    sequences = {sequence["sequence_str_id"]: sequence["nodes_ids"][0] for sequence in pangenome["sequences"]}
+    consensus = pangenome["affinitytree"][0]["nodes_ids"]
+
+    range_start = min(columns[slider_values[0]])
+    range_end = max(columns[slider_values[1]])
+
+    # FILTER SEQUENCES (AFFINITY TREE)
+    if tree_node_id is not None:
+        str_ids = {sequence["sequence_int_id"]: sequence["sequence_str_id"] for sequence in pangenome["sequences"]}
+        tree_node = next(node for node in pangenome["affinitytree"] if node["affinity_node_id"] == tree_node_id)
+        filtered_sequences = [str_ids[int_id] for int_id in tree_node["sequences_int_ids"]]
+    else:
+        filtered_sequences = list(sequences)
+    paths = [sequences[sequence_id] for sequence_id in filtered_sequences]
+    if 3 in checklist:
+        paths = [remove_snp(consensus, path) for path in paths]
+    diagram = construct_diagram(bases, paths)
+
+    if 2 in checklist and threshold > 0:
+        diagram = prune_weak_connections(diagram, range_start, range_end, threshold)
+
+    if 1 in checklist:
+        diagram, diagram_reorganization = bound_vertices(diagram, range_start, range_end)
+    else:
+        diagram_reorganization = dict()
+
+    if highlight_seq and highlight_seq in filtered_sequences:
+        highlight_seq_nodes = [node_id for node_id in sequences[highlight_seq] if node_id not in diagram_reorganization]
+    else:
+        highlight_seq_nodes = []
+
+    label, links = [], []
+    for node_id in range(range_start, range_end+1):
+        label.append(diagram[node_id]["base"])
+        for target, value in diagram[node_id]["targets"].items():
+            if target > range_end:
+                continue
+            if node_id in highlight_seq_nodes:
+                s_id = highlight_seq_nodes.index(node_id)
+                if s_id+1 < len(highlight_seq_nodes) and highlight_seq_nodes[s_id+1] == target:
+                    links.append((node_id-range_start, target-range_start, value-1, LINK_COLOR))
+                    links.append((node_id-range_start, target-range_start, 1, HIGHLIGHT_COLOR))
+                    continue
+            links.append((node_id-range_start, target-range_start, value, LINK_COLOR))
+
+    colors = [BASE_COLORS[l] if l in BASE_COLORS else "gray" for l in label]
+    label = [l if len(l) < 5 else f"{l[0]}...{l[-1]}({len(l)})" for l in label]
+    return label, colors, sorted(links)
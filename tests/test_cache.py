@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from dash_app.components import cache
+
+
+class DiskCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = cache.DiskCache(directory.name, max_bytes=250, suffix=".bin")
+
+    def set(self, key, size, mtime=None):
+        path = self.cache.set(key, lambda f: f.write(b"x" * size))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_least_recently_used_evicted_first(self):
+        self.set("a", 100, mtime=1)
+        self.set("b", 100, mtime=3)
+        self.set("c", 40, mtime=2)
+        # READING a MAKES IT THE MOST RECENTLY USED
+        self.assertIsNotNone(self.cache.get("a"))
+        self.set("d", 100)
+        self.assertIsNone(self.cache.get("c"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("d"))
+
+    def test_newest_entry_kept_over_limit(self):
+        self.set("a", 100)
+        path = self.set("b", 400)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(path, self.cache.get("b"))
+
+    def test_failed_write_leaves_no_file(self):
+        self.set("a", 10)
+
+        def write(f):
+            f.write(b"partial")
+            raise RuntimeError("write failed")
+        with self.assertRaises(RuntimeError):
+            self.cache.set("a", write)
+        with self.assertRaises(RuntimeError):
+            self.cache.set("b", write)
+        self.assertEqual(b"x" * 10, self.cache.get("a").read_bytes())
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(["a.bin"], sorted(os.listdir(self.cache.directory)))
+
+    def test_pop(self):
+        self.set("a", 10)
+        self.cache.pop("a")
+        self.cache.pop("a")
+        self.assertIsNone(self.cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
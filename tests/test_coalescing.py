@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+
+from dash.exceptions import PreventUpdate
+
+from dash_app.components.coalescing import RequestCoalescer
+
+
+class LatestWinsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.coalescer = RequestCoalescer(delay=0.2)
+
+    def test_lone_request_does_not_wait(self):
+        callback = self.coalescer.latest_wins("output")(lambda value: value * 2)
+        started = time.monotonic()
+        self.assertEqual(42, callback(21, "page"))
+        self.assertLess(time.monotonic() - started, self.coalescer.delay)
+        self.assertEqual({}, self.coalescer.latest)
+
+    def test_stale_request_is_dropped(self):
+        running, release = threading.Event(), threading.Event()
+
+        def slow(value):
+            running.set()
+            release.wait()
+            return value
+        callback = self.coalescer.latest_wins("output")(slow)
+        results = {}
+
+        def call(value):
+            try:
+                results[value] = callback(value, "page")
+            except PreventUpdate:
+                results[value] = None
+        first = threading.Thread(target=call, args=(1,))
+        first.start()
+        running.wait()
+        # BOTH WAIT FOR THE RUNNING REQUEST, ONLY THE NEWEST IS COMPUTED
+        second = threading.Thread(target=call, args=(2,))
+        second.start()
+        time.sleep(0.05)
+        third = threading.Thread(target=call, args=(3,))
+        third.start()
+        release.set()
+        for thread in (first, second, third):
+            thread.join()
+        self.assertEqual({1: None, 2: None, 3: 3}, results)
+        self.assertEqual(2, self.coalescer.dropped["output"])
+        self.assertEqual({}, self.coalescer.latest)
+
+    def test_pages_do_not_supersede_each_other(self):
+        key, ticket, in_burst = self.coalescer.start("page", "output")
+        _, other_ticket, other_in_burst = self.coalescer.start("other_page", "output")
+        self.assertFalse(in_burst)
+        self.assertFalse(other_in_burst)
+        self.coalescer.check(key, ticket)
+        self.coalescer.finish(key, ticket)
+        self.assertEqual({("other_page", "output"): other_ticket}, self.coalescer.latest)
+
+    def test_zero_delay_never_waits(self):
+        coalescer = RequestCoalescer(delay=0)
+        key, ticket, _ = coalescer.start("page", "output")
+        callback = coalescer.latest_wins("output")(lambda value: value)
+        # THE REQUEST IN FLIGHT IS SUPERSEDED, THE NEW ONE RUNS AT ONCE
+        self.assertEqual(1, callback(1, "page"))
+        with self.assertRaises(PreventUpdate):
+            coalescer.check(key, ticket)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from pathlib import Path
+
+import ddt
+import numpy as np
+import pandas as pd
+
+from dash_app.components import consensustable, consensustree, pangenome, views
+
+EXAMPLE_DATA = Path(__file__).resolve().parent.parent / "example_data" / "pangtreevis"
+
+
+def load_example(name):
+    with open(EXAMPLE_DATA / name / "pangenome.json") as f:
+        text = f.read()
+    pangenome.get_pangenome(name, lambda: pangenome.read_text(text))
+    return name
+
+
+def get_rows_order(table, sort_by):
+    ranks = [consensustable.get_column_ranks(table[column]) for column, _ in sort_by]
+    return consensustable.get_rows_order(ranks,
+                                         [np.argsort(column_ranks, kind="stable") for column_ranks in ranks],
+                                         [direction == "desc" for _, direction in sort_by])
+
+
+@ddt.ddt
+class ConsensusesVisibilityTests(unittest.TestCase):
+
+    @ddt.data("toy_example", "ebola_subset")
+    def test_columns_match_remove_smaller_than_slider(self, name):
+        dataset_key = load_example(name)
+        full_table = views.get(views.get_key("full_consensustable", dataset_key))
+        tree = views.get(views.get_key("consensustree", dataset_key))
+        mincomps = [tree.nodes[node_id]["mincomp"] for node_id in tree.nodes]
+        # EVERY MINCOMP IS A BORDER OF SOME INTERVAL, THE SLIDER STOPS ON IT
+        for slider_value in sorted(set(np.round(np.arange(0, 1.001, 0.01), 2).tolist() + mincomps)):
+            with self.subTest(slider_value=slider_value):
+                expected = consensustable.remove_smaller_than_slider(full_table, consensustree.dict_to_tree(
+                    consensustree.tree_to_dict(tree)), slider_value)
+                self.assertEqual(list(expected.columns),
+                                 views.get(views.get_key("partial_consensustable", dataset_key, slider_value)))
+
+
+@ddt.ddt
+class RowsOrderTests(unittest.TestCase):
+
+    @ddt.data(
+        [["group", "asc"]],
+        [["group", "desc"], ["CONSENSUS5", "asc"]],
+        [["CONSENSUS5", "desc"]],
+        [["name", "asc"], ["ID", "desc"]],
+    )
+    def test_example_order_matches_sort_values(self, sort_by):
+        dataset_key = load_example("ebola_subset")
+        full_table = views.get(views.get_key("full_consensustable", dataset_key))
+        expected = full_table.sort_values([column for column, _ in sort_by],
+                                          ascending=[direction == "asc" for _, direction in sort_by],
+                                          kind="stable", na_position="last").index.to_numpy()
+        np.testing.assert_array_equal(expected, views.get(views.get_key("rows_order", dataset_key, sort_by)))
+
+    @ddt.data(
+        [["a", "asc"]],
+        [["a", "desc"]],
+        [["a", "desc"], ["b", "asc"]],
+        [["b", "desc"], ["a", "desc"], ["c", "asc"]],
+    )
+    def test_missing_values_stay_last(self, sort_by):
+        rnd = np.random.default_rng(0)
+        table = pd.DataFrame({
+            "a": rnd.choice([0.25, 0.5, 1.0, np.nan], 200).astype(np.float32),
+            "b": rnd.choice(["x", "y", "z", None], 200),
+            "c": rnd.integers(0, 5, 200),
+        })
+        expected = table.sort_values([column for column, _ in sort_by],
+                                     ascending=[direction == "asc" for _, direction in sort_by],
+                                     kind="stable", na_position="last").index.to_numpy()
+        np.testing.assert_array_equal(expected, get_rows_order(table, sort_by))
+
+    def test_mixed_types_column_ranks(self):
+        column = pd.Series(["b", 1, None, "a", 2.5, np.nan, "b"], dtype=object)
+        np.testing.assert_array_equal([4, 1, 8, 3, 2, 8, 4], consensustable.get_column_ranks(column))
+
+
+@ddt.ddt
+class ColumnsWindowTests(unittest.TestCase):
+
+    @ddt.data((0, 0), (30, 30), (70, 70), (500, 70))
+    @ddt.unpack
+    def test_offset_is_clamped(self, offset, first_shown):
+        consensus_columns = [f"CONSENSUS{i}" for i in range(120)]
+        window = consensustable.get_columns_window(["ID", "SEQID"], consensus_columns, offset)
+        self.assertEqual(["ID", "SEQID"] + consensus_columns[first_shown:first_shown+consensustable.CONSENSUS_COLUMNS_WINDOW],
+                         window)
+
+    def test_fewer_columns_than_window(self):
+        self.assertEqual(["ID", "CONSENSUS0", "CONSENSUS1"],
+                         consensustable.get_columns_window(["ID"], ["CONSENSUS0", "CONSENSUS1"], 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import base64
+import unittest
+
+import ddt
+import numpy as np
+import plotly.graph_objs as go
+
+from dash_app.components import figures
+
+TYPED_ARRAYS = {"<i4": np.int32, "<f4": np.float32, "<u1": np.uint8}
+
+
+def decode_values(value):
+    """Same as figures.decode in dash_app/assets/figures.js."""
+    if isinstance(value, list):
+        return [decode_values(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "bdata" in value and "dtype" in value:
+        return np.frombuffer(base64.b64decode(value["bdata"]), dtype=TYPED_ARRAYS[value["dtype"]]).tolist()
+    if "palette" in value and "indices" in value:
+        return [value["palette"][index] for index in decode_values(value["indices"])]
+    return {key: decode_values(item) for key, item in value.items()}
+
+
+@ddt.ddt
+class EncodeFigureTests(unittest.TestCase):
+
+    def test_sankey_round_trip(self):
+        rnd = np.random.default_rng(0)
+        label = rnd.choice(list("ACGT"), 100).tolist() + ["A...T(12)"]
+        source, target = rnd.integers(0, 100, 300).tolist(), rnd.integers(0, 100, 300).tolist()
+        value = rnd.integers(1, 50, 300).tolist()
+        color = rnd.choice(["#D3D3D3", "#342424"], 300).tolist()
+        x = rnd.random(101).astype(np.float32).tolist()
+        fig = go.Figure(data=go.Sankey(node=dict(label=label, x=x, pad=10), link=dict(source=source, target=target, value=value, color=color)))
+        sankey = decode_values(figures.encode_figure(fig, "test")["data"])[0]
+        self.assertEqual(label, sankey["node"]["label"])
+        self.assertEqual(x, sankey["node"]["x"])
+        self.assertEqual(10, sankey["node"]["pad"])
+        self.assertEqual(source, sankey["link"]["source"])
+        self.assertEqual(target, sankey["link"]["target"])
+        self.assertEqual(value, sankey["link"]["value"])
+        self.assertEqual(color, sankey["link"]["color"])
+
+    def test_none_becomes_nan(self):
+        values = [0.5, None] * 10
+        decoded = decode_values(figures.encode_values(values))
+        self.assertEqual([0.5] * 10, decoded[::2])
+        self.assertTrue(np.isnan(decoded[1::2]).all())
+
+    @ddt.data(
+        [1, 2, 3],
+        ["A"] * 15,
+        [True, False] * 10,
+        [str(i) for i in range(20)],
+        [1, "a"] * 10,
+    )
+    def test_values_sent_as_json(self, values):
+        # SHORT, BOOLEAN, MIXED OR MOSTLY UNIQUE VALUES ARE NOT PACKED
+        self.assertEqual(values, figures.encode_values(values))
+
+    def test_arrays_are_packed(self):
+        encoded = figures.encode_values(dict(a=np.arange(20), b=np.linspace(0, 1, 20), c=["G", "T"] * 10))
+        self.assertEqual("<i4", encoded["a"]["dtype"])
+        self.assertEqual("<f4", encoded["b"]["dtype"])
+        self.assertEqual(["G", "T"], encoded["c"]["palette"])
+        self.assertEqual(list(range(20)), decode_values(encoded)["a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
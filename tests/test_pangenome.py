@@ -0,0 +1,107 @@
+import base64
+import json
+import threading
+import unittest
+from pathlib import Path
+
+import ddt
+import numpy as np
+from dash.exceptions import PreventUpdate
+
+from dash_app.components import pangenome
+
+EXAMPLE_DATA = Path(__file__).resolve().parent.parent / "example_data" / "pangtreevis"
+
+
+def read_example_text(name):
+    with open(EXAMPLE_DATA / name / "pangenome.json") as f:
+        return f.read()
+
+
+def read_json(stream):
+    """Same value as json.loads, read through the streaming calls used by read_pangenome."""
+    if stream.peek() == "{":
+        return {key: read_json(stream) for key in stream.iter_object()}
+    if stream.peek() == "[":
+        return list(stream.iter_array())
+    return stream.read_value()
+
+
+@ddt.ddt
+class JSONStreamTests(unittest.TestCase):
+
+    TEXT = '{"a": 12345, "b" : [1.5e3, "xy\\u00e9 \\"z\\"", true, null, -0.25, []], "c": {"d": [[1, 22], {}]}, "e": "\u00e9"}'
+
+    @ddt.data(1, 2, 3, 5, 7, 64)
+    def test_values_span_chunks(self, chunk_size):
+        stream = pangenome.JSONStream(pangenome.iter_text(self.TEXT, chunk_size))
+        self.assertEqual(json.loads(self.TEXT), read_json(stream))
+
+    @ddt.data(1, 2, 3)
+    def test_number_split_at_the_end(self, chunk_size):
+        for text in ["[12, 345]", "12345", "[-1.25e10]"]:
+            with self.subTest(text=text):
+                self.assertEqual(json.loads(text), read_json(pangenome.JSONStream(pangenome.iter_text(text, chunk_size))))
+
+    def test_unexpected_end(self):
+        for text in ["[1, 2", '{"a": [1', '["ab']:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                read_json(pangenome.JSONStream(pangenome.iter_text(text, 2)))
+
+    @ddt.data(4, 8, 12)
+    def test_upload_characters_span_chunks(self, chunk_size):
+        content = "data:application/json;base64," + base64.b64encode(self.TEXT.encode()).decode()
+        self.assertEqual(self.TEXT, "".join(pangenome.iter_upload_text(content, chunk_size)))
+
+    @ddt.data(7, 100)
+    def test_pangenome_read_in_small_chunks(self, chunk_size):
+        text = read_example_text("toy_example")
+        expected = pangenome.read_text(text)
+        data = pangenome.read_pangenome(pangenome.iter_text(text, chunk_size))
+        for name in ["node_ids", "node_bases", "node_columns", "node_blocks", "sequences_int_ids", "paths",
+                     "paths_offsets", "compatibilities"]:
+            np.testing.assert_array_equal(getattr(expected, name), getattr(data, name))
+        self.assertEqual(expected.sequences_str_ids, data.sequences_str_ids)
+        self.assertEqual(expected.sequences_metadata, data.sequences_metadata)
+
+
+class GetPangenomeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.text = read_example_text("toy_example")
+
+    def test_concurrent_callbacks_parse_once(self):
+        dataset_key = "parses-concurrent"
+        results = [None] * 5
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(
+            i, pangenome.get_pangenome(dataset_key, lambda: pangenome.read_text(self.text))))
+            for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, pangenome.parses[dataset_key])
+        self.assertTrue(all(data is results[0] for data in results))
+
+    def test_evicted_pangenome_is_loaded_from_disk(self):
+        dataset_key = "parses-evicted"
+        parsed = pangenome.get_pangenome(dataset_key, lambda: pangenome.read_text(self.text))
+        pangenome.pangenomes.pop(dataset_key)
+
+        def read():
+            raise AssertionError("parsed again")
+        loaded = pangenome.get_pangenome(dataset_key, read)
+        self.assertEqual(1, pangenome.parses[dataset_key])
+        self.assertIsNot(parsed, loaded)
+        np.testing.assert_array_equal(parsed.paths, loaded.paths)
+        np.testing.assert_array_equal(parsed.compatibilities, loaded.compatibilities)
+        self.assertEqual(parsed.sequences_str_ids, loaded.sequences_str_ids)
+
+    def test_unknown_dataset_is_not_read(self):
+        with self.assertRaises(PreventUpdate):
+            pangenome.get_dataset("parses-unknown")
+        self.assertEqual(0, pangenome.parses["parses-unknown"])
+
+
+if __name__ == '__main__':
+    unittest.main()
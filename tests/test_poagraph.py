@@ -0,0 +1,398 @@
+import copy
+import json
+import random
+import threading
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+import ddt
+import numpy as np
+
+from dash_app.components import pangenome, poagraph
+from tests import baseline
+
+EXAMPLE_DATA = Path(__file__).resolve().parent.parent / "example_data" / "pangtreevis"
+
+
+def read_example(name):
+    with open(EXAMPLE_DATA / name / "pangenome.json") as f:
+        return json.load(f)
+
+
+def get_synthetic_pangenome(seed, columns_count=120, sequences_count=24, bubble_size=3):
+    """Columns of up to bubble_size alternative nodes, sequences pass one node per column or skip it.
+
+    The consensus passes the first node of every column, the affinity tree splits the sequences in halves.
+    """
+    rnd = random.Random(seed)
+    nodes, column_nodes = [], []
+    for column_id in range(columns_count):
+        column_nodes.append(list(range(len(nodes), len(nodes) + rnd.randint(1, bubble_size))))
+        nodes.extend(dict(id=node_id, base=rnd.choice("ACGT"), column_id=column_id, block_id=0, aligned_to=None)
+                     for node_id in column_nodes[-1])
+    sequences = []
+    for i in range(sequences_count):
+        path = [rnd.choice(column) if rnd.random() < 0.3 else column[0]
+                for column_id, column in enumerate(column_nodes)
+                if column_id in (0, columns_count-1) or rnd.random() > 0.1]
+        sequences.append(dict(sequence_int_id=i, sequence_str_id=f"seq{i}", nodes_ids=[path], metadata={}))
+
+    def get_tree_node(affinity_node_id, parent, children, sequences_int_ids):
+        return dict(affinity_node_id=affinity_node_id, parent=parent, children=children,
+                    name=f"CONSENSUS{affinity_node_id}", nodes_ids=[column[0] for column in column_nodes],
+                    sequences_int_ids=sequences_int_ids, mincomp=rnd.random(),
+                    comp_to_all_sequences={f"seq{i}": rnd.random() for i in range(sequences_count)})
+    half = sequences_count // 2
+    affinitytree = [get_tree_node(0, None, [1, 2], list(range(sequences_count))),
+                    get_tree_node(1, 0, [], list(range(half))),
+                    get_tree_node(2, 0, [], list(range(half, sequences_count)))]
+    return dict(affinitytree=affinitytree, dagmaf_nodes=[], nodes=nodes, sequences=sequences, task_parameters={})
+
+
+def get_alignment(pangenome_json):
+    return poagraph.GraphAlignment(pangenome.read_text(json.dumps(pangenome_json)))
+
+
+def get_windows(columns_count, rnd, count):
+    windows = [[0, columns_count-1], [0, min(40, columns_count-1)], [max(0, columns_count-30), columns_count-1]]
+    for _ in range(count):
+        column_start = rnd.randrange(columns_count)
+        windows.append([column_start, min(columns_count-1, column_start + rnd.randrange(1, 300))])
+    return windows
+
+
+def get_sankey(alignment, slider_values, highlight_seq, tree_node_id, checklist, threshold):
+    click_data = {"points": [{"pointIndex": tree_node_id}]} if tree_node_id is not None else None
+    fig, _ = alignment.get_sankey_diagram(False, slider_values, highlight_seq, click_data, checklist, threshold)
+    sankey = fig.data[0]
+    links = sorted(zip(sankey.link.source, sankey.link.target, sankey.link.value, sankey.link.color))
+    return list(sankey.node.label), list(sankey.node.color), links
+
+
+@ddt.ddt
+class SankeyDiagramTests(unittest.TestCase):
+    """Every window drawn node by node matches the reference dict-based pipeline."""
+
+    CHECKLISTS = [[], [1], [2], [3], [1, 2], [1, 3], [2, 3], [1, 2, 3]]
+
+    def assert_same_diagrams(self, pangenome_json, windows, rnd):
+        alignment = get_alignment(pangenome_json)
+        sequences_ids = [sequence["sequence_str_id"] for sequence in pangenome_json["sequences"]]
+        tree_nodes_ids = [None] + [node["affinity_node_id"] for node in pangenome_json["affinitytree"]][:3]
+        for window in windows:
+            for tree_node_id in tree_nodes_ids:
+                for checklist in self.CHECKLISTS:
+                    threshold = rnd.choice([0, 1, 3, 10]) if 2 in checklist else 5
+                    highlight_seq = rnd.choice(["", *sequences_ids])
+                    parameters = (window, highlight_seq, tree_node_id, checklist, threshold)
+                    with self.subTest(parameters=parameters):
+                        self.assertEqual(baseline.get_sankey(pangenome_json, *parameters),
+                                         get_sankey(alignment, *parameters))
+
+    @ddt.data("toy_example", "ebola_subset")
+    def test_example_windows(self, name):
+        pangenome_json = read_example(name)
+        columns_count = len({node["column_id"] for node in pangenome_json["nodes"]})
+        rnd = random.Random(name)
+        self.assert_same_diagrams(pangenome_json, get_windows(columns_count, rnd, 3), rnd)
+
+    @ddt.data(0, 1, 2, 3)
+    def test_synthetic_windows(self, seed):
+        pangenome_json = get_synthetic_pangenome(seed)
+        rnd = random.Random(seed)
+        self.assert_same_diagrams(pangenome_json, get_windows(120, rnd, 2), rnd)
+
+
+@ddt.ddt
+class WindowSimplificationTests(unittest.TestCase):
+    """Pruning and chains of random windows match the reference on the dict window."""
+
+    def get_random_window(self, alignment, rnd):
+        column_start = rnd.randrange(alignment.columns_count - 1)
+        column_end = min(alignment.columns_count - 1, column_start + rnd.randrange(1, 400))
+        tree_node_id = rnd.choice([None, *alignment.affinity_sequences])
+        _, subset_bits = alignment._get_subset(tree_node_id)
+        return column_start, column_end, rnd.random() < 0.5, tree_node_id, subset_bits
+
+    @ddt.data("ebola_subset", 0, 1)
+    def test_prune_weak_connections(self, source):
+        pangenome_json = read_example(source) if isinstance(source, str) else get_synthetic_pangenome(source)
+        alignment = get_alignment(pangenome_json)
+        rnd = random.Random(str(source))
+        for _ in range(100):
+            column_start, column_end, snp_removed, _, subset_bits = self.get_random_window(alignment, rnd)
+            range_start = int(alignment.column_offsets[column_start])
+            range_end = int(alignment.column_offsets[column_end+1]) - 1
+            threshold = rnd.randrange(1, 20)
+            diagram = alignment.snp_diagram if snp_removed else alignment.diagram
+            outgoing = diagram.outgoing(range_start, range_end, subset_bits)
+            incoming = diagram.incoming(range_start, range_end, subset_bits)
+            expected = baseline.prune_weak_connections(alignment._get_window(outgoing, incoming, range_start, range_end),
+                                                       range_start, range_end, threshold)
+            out_kept, in_kept = poagraph.prune_weak_connections(outgoing, incoming, range_start, range_end, threshold)
+            pruned = alignment._get_window(tuple(edges[out_kept] for edges in outgoing),
+                                           tuple(edges[in_kept] for edges in incoming), range_start, range_end)
+            with self.subTest(window=(range_start, range_end), threshold=threshold):
+                self.assertEqual(expected, pruned)
+
+    @ddt.data("ebola_subset", 0, 1)
+    def test_tiled_window(self, source):
+        pangenome_json = read_example(source) if isinstance(source, str) else get_synthetic_pangenome(source)
+        alignment = get_alignment(pangenome_json)
+        rnd = random.Random(str(source))
+        for _ in range(100):
+            column_start, column_end, snp_removed, tree_node_id, subset_bits = self.get_random_window(alignment, rnd)
+            merge = rnd.random() < 0.6
+            range_start = int(alignment.column_offsets[column_start])
+            range_end = int(alignment.column_offsets[column_end+1]) - 1
+            diagram = alignment.snp_diagram if snp_removed else alignment.diagram
+            window = alignment._get_window(diagram.outgoing(range_start, range_end, subset_bits),
+                                           diagram.incoming(range_start, range_end, subset_bits), range_start, range_end)
+            reorganization = {}
+            if merge:
+                window, reorganization = baseline.bound_vertices(copy.deepcopy(window), range_start, range_end)
+            label, sources, targets, weights, merged = alignment._get_tiled_window(
+                column_start, column_end, snp_removed, merge, tree_node_id, subset_bits)
+            with self.subTest(window=(range_start, range_end), snp_removed=snp_removed, merge=merge):
+                self.assertEqual([window[node_id]["base"] for node_id in range(range_start, range_end+1)], label)
+                self.assertEqual(sorted((node_id, target, weight) for node_id in range(range_start, range_end+1)
+                                        for target, weight in window[node_id]["targets"].items() if target <= range_end),
+                                 sorted(zip(sources.tolist(), targets.tolist(), weights.tolist())))
+                self.assertEqual(set(reorganization), set((np.flatnonzero(merged) + range_start).tolist()))
+
+    @ddt.data(0, 1, 2)
+    def test_traversed_edges(self, tree_node_id):
+        alignment = get_alignment(read_example("ebola_subset"))
+        _, subset_bits = alignment._get_subset(tree_node_id)
+        for diagram in (alignment.diagram, alignment.snp_diagram):
+            sources, targets, _ = diagram.outgoing(0, len(alignment.node_ids)-1, subset_bits)
+            traversed = diagram.traversed_by(subset_bits)
+            np.testing.assert_array_equal(sources, diagram.sources[traversed])
+            np.testing.assert_array_equal(targets, diagram.targets[traversed])
+
+    def test_chains_follow_single_edges(self):
+        alignment = get_alignment(read_example("ebola_subset"))
+        roots, members, members_offsets = alignment.get_chains(False, None)
+        sources, targets, _ = alignment.diagram.outgoing(0, len(alignment.node_ids)-1)
+        out_degree = np.bincount(sources, minlength=len(alignment.node_ids))
+        in_degree = np.bincount(targets, minlength=len(alignment.node_ids))
+        for root in np.unique(roots).tolist():
+            chain = members[members_offsets[root]:members_offsets[root+1]].tolist()
+            self.assertEqual(root, chain[0])
+            for source, target in zip(chain[:-1], chain[1:]):
+                self.assertEqual(1, out_degree[source])
+                self.assertEqual(1, in_degree[target])
+
+
+@ddt.ddt
+class MultipleHighlightTests(unittest.TestCase):
+    """Every highlighted sequence splits its own unit links off the links drawn without highlight."""
+
+    def get_highlighted_links(self, alignment, window, highlight_seqs, tree_node_id, checklist):
+        _, _, links = get_sankey(alignment, window, highlight_seqs, tree_node_id, checklist, 0)
+        return Counter({(source, target, color): value for source, target, value, color in links})
+
+    @ddt.data(([0, 40], None, []), ([30, 119], None, [1, 3]), ([0, 119], 1, []), ([10, 90], 2, [1]))
+    @ddt.unpack
+    def test_links_compose_single_highlights(self, window, tree_node_id, checklist):
+        alignment = get_alignment(get_synthetic_pangenome(4))
+        highlight_seqs = ["seq3", "seq14", "seq0", "seq21"]
+        links = self.get_highlighted_links(alignment, window, highlight_seqs, tree_node_id, checklist)
+        expected = self.get_highlighted_links(alignment, window, [], tree_node_id, checklist)
+        subset = set(alignment.affinity_sequences[tree_node_id].tolist()) if tree_node_id is not None else None
+        # A SEQUENCE KEEPS THE COLOUR OF ITS PLACE IN THE SELECTION, EVEN IF EARLIER ONES ARE OUTSIDE THE SUBSET
+        for seq_id, color in zip(highlight_seqs, poagraph.HIGHLIGHT_COLORS):
+            if subset is not None and alignment.sequences_indices[seq_id] not in subset:
+                continue
+            single = self.get_highlighted_links(alignment, window, seq_id, tree_node_id, checklist)
+            for (source, target, link_color), value in single.items():
+                if link_color != poagraph.LINK_COLOR:
+                    expected[(source, target, color)] += value
+                    expected[(source, target, poagraph.LINK_COLOR)] -= value
+        self.assertEqual({key: value for key, value in expected.items() if key[2] != poagraph.LINK_COLOR},
+                         {key: value for key, value in links.items() if key[2] != poagraph.LINK_COLOR})
+        self.assertEqual(+Counter({key: value for key, value in expected.items() if key[2] == poagraph.LINK_COLOR}),
+                         +Counter({key: value for key, value in links.items() if key[2] == poagraph.LINK_COLOR}))
+
+
+@ddt.ddt
+class FixedPositionsTests(unittest.TestCase):
+    """Window nodes are placed by their column and their rank in it, the consensus on top."""
+
+    def test_ranks_within_columns(self):
+        rnd = np.random.default_rng(0)
+        columns = rnd.integers(0, 30, 200)
+        order = np.lexsort((rnd.random(200), columns))
+        ranks = poagraph.get_ranks(columns, order)
+        for column in range(30):
+            np.testing.assert_array_equal(np.arange((columns == column).sum()), ranks[order[columns[order] == column]])
+
+    @ddt.data([0, 40], [57, 119], [0, 119])
+    def test_consensus_on_top(self, window):
+        pangenome_json = get_synthetic_pangenome(5)
+        alignment = get_alignment(pangenome_json)
+        fig, _ = alignment.get_sankey_diagram(False, window, "", None, [], 0)
+        range_start = int(alignment.column_offsets[window[0]])
+        range_end = int(alignment.column_offsets[window[1]+1]) - 1
+        node_columns = alignment.node_columns[range_start:range_end+1].tolist()
+        x, y = fig.data[0].node.x, fig.data[0].node.y
+        self.assertEqual(len(node_columns), len(x))
+        self.assertTrue(all(0 < position < 1 for position in x + y))
+        consensus = set(pangenome_json["affinitytree"][0]["nodes_ids"])
+        for column in range(window[0], window[1]+1):
+            nodes = [i for i, node_column in enumerate(node_columns) if node_column == column]
+            with self.subTest(column=column):
+                self.assertEqual(1, len({x[i] for i in nodes}))
+                self.assertEqual(len(nodes), len({y[i] for i in nodes}))
+                top = min(nodes, key=lambda i: y[i])
+                self.assertIn(range_start + top, consensus)
+        # COLUMNS ARE SPREAD LEFT TO RIGHT
+        column_x = sorted({(column, x[i]) for i, column in enumerate(node_columns)})
+        self.assertEqual(column_x, sorted(column_x, key=lambda item: item[1]))
+
+
+@ddt.ddt
+class GapProfileTests(unittest.TestCase):
+
+    @ddt.data("toy_example", "ebola_subset", 0)
+    def test_gaps_match_columns_passed(self, source):
+        pangenome_json = read_example(source) if isinstance(source, str) else get_synthetic_pangenome(source)
+        alignment = get_alignment(pangenome_json)
+        node_columns = {node["id"]: node["column_id"] for node in pangenome_json["nodes"]}
+        passed = Counter(node_columns[node_id] for sequence in pangenome_json["sequences"]
+                         for path in sequence["nodes_ids"] for node_id in path)
+        sequences_count = len(pangenome_json["sequences"])
+        expected = [(sequences_count - passed[column]) / sequences_count for column in range(alignment.columns_count)]
+        np.testing.assert_allclose(expected, alignment.find_gaps())
+
+    @ddt.data((1, 10), (7, 3), (1000, 10), (1011, 1000), (5000, 1000))
+    @ddt.unpack
+    def test_downsampled_bins(self, values_count, bins):
+        values = np.random.default_rng(values_count).random(values_count)
+        starts, mins, maxs, means = poagraph.downsample(values, bins)
+        self.assertLessEqual(len(starts), bins)
+        self.assertEqual(0, starts[0])
+        for i, (start, end) in enumerate(zip(starts.tolist(), starts.tolist()[1:] + [values_count])):
+            self.assertLess(start, end)
+            self.assertEqual(values[start:end].min(), mins[i])
+            self.assertEqual(values[start:end].max(), maxs[i])
+            self.assertAlmostEqual(values[start:end].mean(), means[i])
+
+
+@ddt.ddt
+class LevelsOfDetailTests(unittest.TestCase):
+    """Coarsened levels keep the sequences' walks and the zoomed-out diagram draws the chosen level."""
+
+    def get_level_paths(self, level):
+        return [level.paths[level.offsets[i]:level.offsets[i+1]].tolist() for i in range(len(level.offsets)-1)]
+
+    @ddt.data("ebola_subset", 0, 1)
+    def test_level_paths_are_walks(self, source):
+        pangenome_json = read_example(source) if isinstance(source, str) else get_synthetic_pangenome(source)
+        alignment = get_alignment(pangenome_json)
+        self.assertTrue(alignment.levels)
+        for level in alignment.levels:
+            paths = self.get_level_paths(level)
+            # LIKE THE NODE DIAGRAM, THE LAST EDGE OF EVERY SEQUENCE IS NOT DRAWN
+            pairs = Counter((source, target) for path in paths for source, target in zip(path[:-2], path[1:-1]))
+            sources, targets, weights = level.diagram.outgoing(0, len(level.labels)-1)
+            with self.subTest(width=level.width):
+                self.assertEqual(pairs, Counter(dict(zip(zip(sources.tolist(), targets.tolist()), weights.tolist()))))
+                for i, path in enumerate(paths):
+                    columns = alignment.node_columns[alignment.paths[alignment.paths_offsets[i]:alignment.paths_offsets[i+1]]]
+                    self.assertLessEqual(level.first_columns[path[0]], columns[0])
+                    self.assertGreaterEqual(level.last_columns[path[-1]], columns[-1])
+                    self.assertTrue(all(level.last_columns[source] < level.first_columns[target]
+                                        for source, target in zip(path[:-1], path[1:])))
+
+    @ddt.data(0, 2)
+    def test_first_level_within_limit(self, seed):
+        limit = 12
+        with mock.patch.object(poagraph, "SANKEY_NODES_LIMIT", limit):
+            alignment = get_alignment(get_synthetic_pangenome(seed, columns_count=400))
+            self.assertGreater(len(alignment.levels), 1)
+            rnd = random.Random(seed)
+            for column_start, column_end in get_windows(alignment.columns_count, rnd, 20):
+                level = alignment.get_level(column_start, column_end)
+                counts = [len(level.get_nodes(column_start, column_end)) for level in alignment.levels]
+                index = alignment.levels.index(level)
+                with self.subTest(window=(column_start, column_end), counts=counts):
+                    self.assertTrue(all(count > limit for count in counts[:index]))
+                    self.assertTrue(counts[index] <= limit or index == len(alignment.levels)-1)
+
+    def test_level_nodes_overlap_window(self):
+        alignment = get_alignment(get_synthetic_pangenome(0, columns_count=400))
+        for level in alignment.levels:
+            for column_start, column_end in [(0, 0), (37, 90), (100, 399), (399, 399)]:
+                nodes = level.get_nodes(column_start, column_end).tolist()
+                expected = [node for node in range(len(level.labels))
+                            if level.first_columns[node] <= column_end and level.last_columns[node] >= column_start]
+                self.assertEqual(expected, nodes)
+
+    @ddt.data(None, 1)
+    def test_zoom_out_draws_level_links(self, tree_node_id):
+        pangenome_json = get_synthetic_pangenome(2, columns_count=400)
+        alignment = get_alignment(pangenome_json)
+        level = alignment.get_level(0, alignment.columns_count-1)
+        click_data = {"points": [{"pointIndex": tree_node_id}]} if tree_node_id is not None else None
+        fig, _ = alignment.get_sankey_diagram(True, [0, alignment.columns_count-1], "", click_data, [], 0)
+        sankey = fig.data[0]
+        nodes = level.get_nodes(0, alignment.columns_count-1).tolist()
+        subset = range(len(pangenome_json["sequences"])) if tree_node_id is None else alignment.affinity_sequences[tree_node_id]
+        expected = Counter((nodes.index(source), nodes.index(target))
+                           for path in [self.get_level_paths(level)[i] for i in subset]
+                           for source, target in zip(path[:-2], path[1:-1]))
+        self.assertEqual([level.labels[node] for node in nodes], list(sankey.node.label))
+        self.assertEqual(expected, Counter(dict(zip(zip(sankey.link.source, sankey.link.target), sankey.link.value))))
+
+    def test_single_column_has_no_levels(self):
+        alignment = get_alignment(get_synthetic_pangenome(0, columns_count=1))
+        self.assertEqual([], alignment.levels)
+        self.assertIsNone(alignment.get_level(0, 0))
+        self.assertIsNone(alignment.get_window_level(True, [0, 0]))
+        fig, _ = alignment.get_sankey_diagram(True, [0, 0], "", None, [], 0)
+        self.assertEqual(len(alignment.node_ids), len(fig.data[0].node.label))
+
+
+@ddt.ddt
+class ParallelEdgesTests(unittest.TestCase):
+
+    @ddt.data((24, 2), (30, 3), (12, 4))
+    @ddt.unpack
+    def test_same_as_serial(self, sequences_count, workers):
+        try:
+            from multiprocessing import shared_memory  # noqa: F401
+        except ImportError:
+            self.skipTest("shared memory needs Python 3.8")
+        alignment = get_alignment(get_synthetic_pangenome(6, sequences_count=sequences_count))
+        nodes_count = len(alignment.node_ids)
+        serial = poagraph.count_edges(alignment.paths, alignment.paths_offsets, nodes_count)
+        parallel = poagraph.count_edges_parallel(alignment.paths, alignment.paths_offsets, nodes_count, workers)
+        for serial_values, parallel_values in zip(serial, parallel):
+            np.testing.assert_array_equal(serial_values, parallel_values)
+
+
+class AlignmentsRegistryTests(unittest.TestCase):
+
+    def test_concurrent_callbacks_build_once(self):
+        with open(EXAMPLE_DATA / "toy_example" / "pangenome.json") as f:
+            text = f.read()
+        dataset_key = "registry-toy_example"
+        pangenome.get_pangenome(dataset_key, lambda: pangenome.read_text(text))
+        results = [None] * 5
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, poagraph.get_alignment(dataset_key)))
+                   for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, poagraph.builds[dataset_key])
+        self.assertTrue(all(alignment is results[0] for alignment in results))
+        self.assertIs(results[0], poagraph.get_alignment(dataset_key))
+        self.assertEqual(1, poagraph.builds[dataset_key])
+
+
+if __name__ == '__main__':
+    unittest.main()